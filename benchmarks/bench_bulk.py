@@ -0,0 +1,59 @@
+"""bench_bulk.py
+    Per-event batchEvent loop (as in example.py) versus batchEvents() fed by a generator.
+
+    Reports events/s for both and peak RSS, which should stay flat for the generator however many events are sent.
+
+    Usage:
+        python benchmarks/bench_bulk.py [events]
+"""
+
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector
+from stub_hec import StubHEC
+
+suspects = ['Miss Scarett','Professor Plum','Miss Peacock','Mr. Green','Colonel Mustard','Mrs. White']
+weapons = ['candlestick','knife','lead pipe','revolver','rope','wrench']
+rooms = ['kitchen','ballroom','conservatory','dining room','cellar','billiard room','library','lounge','hall','study']
+
+
+def crimes(count):
+    for i in range(count):
+        event = {"killer":random.choice(suspects), "weapon":random.choice(weapons), "location":random.choice(rooms), "victim":"Mr Boddy"}
+        event.update({"action":"success", "crime_type":"batch", "crime_number":i})
+        yield {"index":"test", "sourcetype":"crime", "source":"witness", "host":"mansion", "event":event}
+
+
+def peakRSSMB():
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with StubHEC() as hec:
+        collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+        collector.popNullFields = True
+
+        start = time.time()
+        for payload in crimes(count):
+            collector.batchEvent(payload)
+        collector.flushBatch()
+        elapsed = time.time() - start
+        print("batchEvent loop   %10.1f events/s peak RSS %6.1f MB" % (count / elapsed, peakRSSMB()))
+
+        start = time.time()
+        collector.sendStream(crimes(count))
+        elapsed = time.time() - start
+        print("sendStream        %10.1f events/s peak RSS %6.1f MB" % (count / elapsed, peakRSSMB()))
+        print("events received %d of %d" % (hec.events, 2 * count))
+
+
+if __name__ == "__main__":
+    main()
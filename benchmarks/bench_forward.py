@@ -0,0 +1,54 @@
+"""bench_forward.py
+    Throughput of splunk-hec-forward reading a large log file against the stub HEC.
+
+    Writes a log file of the given size, forwards it with --once and reports MB/s and lines/s,
+    then forwards it again to show the checkpoint prevents any re-send.
+
+    Usage:
+        python benchmarks/bench_forward.py [megabytes]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import splunk_hec_forward
+from stub_hec import StubHEC
+
+LINE = "Jan  1 00:00:00 mansion sshd[%d]: Accepted publickey for plum from 10.0.0.%d port 22 ssh2\n"
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'secure.log')
+    with open(path, 'w') as f:
+        written = 0
+        i = 0
+        while written < megabytes * 1048576:
+            lines = ''.join(LINE % (i + n, n % 255) for n in range(10000))
+            f.write(lines)
+            written += len(lines)
+            i += 10000
+    size = os.path.getsize(path)
+    argv = ['--server', '127.0.0.1', '--no-ssl', '--token', 'bench-token', '--sourcetype', 'linux_secure', '--once',
+            '--checkpoint', os.path.join(directory, 'checkpoint'), path]
+    try:
+        with StubHEC() as hec:
+            start = time.time()
+            splunk_hec_forward.main(argv + ['--port', str(hec.port)])
+            elapsed = time.time() - start
+            print("forwarded %.1f MB in %.2fs: %8.1f MB/s %10.1f lines/s, lines received %d" % (size / 1048576.0, elapsed, size / 1048576.0 / elapsed, hec.events / elapsed, hec.events))
+            hec.reset()
+            splunk_hec_forward.main(argv + ['--port', str(hec.port)])
+            print("second run from checkpoint: lines received %d" % hec.events)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
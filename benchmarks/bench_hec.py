@@ -0,0 +1,125 @@
+"""bench_hec.py
+    End-to-end benchmark of http_event_collector against the stub HEC, no Splunk needed.
+
+    Runs the stub in a separate process so CPU per event only counts the client, then drives
+    sendEvent and batchEvent across a grid of threadCount and maxByteLength values and reports
+    events/s, bytes/s, exact p50/p99 post latency and CPU microseconds per event.
+
+    Usage:
+        python benchmarks/bench_hec.py [--events N] [--threads 1,4,10] [--bytes 50000,100000,500000]
+                                       [--latency S] [--busy-rate F] [--reset-rate F] [--gzip]
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_hec.py')
+
+
+def freePort():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def startStub(args):
+    port = freePort()
+    command = [sys.executable, STUB, '--port', str(port), '--latency', str(args.latency), '--busy-rate', str(args.busy_rate), '--reset-rate', str(args.reset_rate)]
+    stub = subprocess.Popen(command, stdout=subprocess.PIPE)
+    stub.stdout.readline()
+    return stub, port
+
+
+def collectorClass(threadCount, maxByteLength):
+    """Subclass with the class level limits overridden, recording the exact latency of every post."""
+
+    def _recordPost(self, status_code, latency, retries):
+        self.latencies.append(latency)
+        http_event_collector._recordPost(self, status_code, latency, retries)
+
+    return type('bench_collector', (http_event_collector,), {'threadCount':threadCount, 'maxQueueSize':100 * threadCount, 'maxByteLength':maxByteLength, '_recordPost':_recordPost})
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def cpuSeconds():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def payloads(count):
+    for i in range(count):
+        yield {"index":"test", "sourcetype":"crime", "source":"witness", "host":"mansion",
+               "event":{"killer":"Professor Plum", "weapon":"rope", "location":"library", "victim":"Mr Boddy", "action":"success", "crime_number":i}}
+
+
+def run(label, collector, count, send):
+    collector.latencies = []
+    startCPU = cpuSeconds()
+    start = time.time()
+    send(collector, count)
+    elapsed = time.time() - start
+    cpu = cpuSeconds() - startCPU
+    stats = collector.stats()
+    print("%-22s %10.1f ev/s %8.2f MB/s p50 %7.2f ms p99 %7.2f ms cpu %6.1f us/ev  posts=%d dropped=%d statuses=%s" % (
+        label, count / elapsed, stats['bytes_queued'] / elapsed / 1048576.0,
+        percentile(collector.latencies, 0.5) * 1000, percentile(collector.latencies, 0.99) * 1000,
+        cpu / count * 1e6, stats['batches_sent'], stats['events_dropped'], stats['status_codes']))
+
+
+def sendSingle(collector, count):
+    for payload in payloads(count):
+        collector.sendEvent(payload)
+
+
+def sendBatched(collector, count):
+    for payload in payloads(count):
+        collector.batchEvent(payload)
+    collector.flushBatch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark http_event_collector against a local stub HEC.")
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--single-events', type=int, default=2000, help="events sent one at a time with sendEvent")
+    parser.add_argument('--threads', default='1,4,10')
+    parser.add_argument('--bytes', default='50000,100000,500000')
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--busy-rate', type=float, default=0)
+    parser.add_argument('--reset-rate', type=float, default=0)
+    parser.add_argument('--gzip', action='store_true', help="enable compressBatches")
+    args = parser.parse_args()
+
+    stub, port = startStub(args)
+    try:
+        for threadCount in [int(x) for x in args.threads.split(',')]:
+            for maxByteLength in [int(x) for x in args.bytes.split(',')]:
+                collector = collectorClass(threadCount, maxByteLength)("bench-token", "127.0.0.1", http_event_port=port, http_event_server_ssl=False)
+                collector.log.setLevel('CRITICAL')
+                collector.compressBatches = args.gzip
+                run("batch t=%d b=%d" % (threadCount, maxByteLength), collector, args.events, sendBatched)
+            collector = collectorClass(threadCount, http_event_collector.maxByteLength)("bench-token", "127.0.0.1", http_event_port=port, http_event_server_ssl=False)
+            collector.log.setLevel('CRITICAL')
+            run("sendEvent t=%d" % threadCount, collector, args.single_events, sendSingle)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
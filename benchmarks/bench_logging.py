@@ -0,0 +1,62 @@
+"""bench_logging.py
+    Per-record cost on the logging thread: NullHandler baseline, a naive handler calling batchEvent, and HECHandler.
+
+    Reports CPU microseconds per logging call spent by the application thread itself (thread_time, so the
+    background drain and sender threads are not counted) and events received by the stub.
+
+    Usage:
+        python benchmarks/bench_logging.py [records]
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector, HECHandler
+from stub_hec import StubHEC
+
+
+class naiveHandler(logging.Handler):
+
+    """Formats and serializes on the logging thread, as a hand written handler would."""
+
+    def __init__(self, collector):
+        logging.Handler.__init__(self)
+        self.collector = collector
+
+    def emit(self, record):
+        self.collector.batchEvent({'event':{'message':record.getMessage(), 'severity':record.levelname.lower(), 'logger':record.name}})
+
+    def flush(self):
+        self.collector.flushBatch()
+
+
+def run(label, handler, hec, count):
+    log = logging.getLogger('bench.' + label)
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    hec.reset()
+    start = time.thread_time()
+    for i in range(count):
+        log.info("crime %s solved by %s", i, "Miss Scarlett")
+    elapsed = time.thread_time() - start
+    handler.flush()
+    print("%-12s %8.2f us/record CPU on the logging thread, events received %d" % (label, elapsed / count * 1e6, hec.events))
+    log.removeHandler(handler)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with StubHEC() as hec:
+        run('null', logging.NullHandler(), hec, count)
+        collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+        run('naive', naiveHandler(collector), hec, count)
+        run('HECHandler', HECHandler(collector), hec, count)
+
+
+if __name__ == "__main__":
+    main()
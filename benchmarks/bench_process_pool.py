@@ -0,0 +1,46 @@
+"""bench_process_pool.py
+    sendStream serialized on the calling thread versus in enableProcessPool worker processes.
+
+    Uses larger events with the standard json serializer so serialization dominates, and reports
+    events/s for each worker count. Gains need as many free cores as workers.
+
+    Usage:
+        python benchmarks/bench_process_pool.py [events] [workers,...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector, _stdlib_dumps
+from stub_hec import StubHEC
+
+
+def events(count):
+    for i in range(count):
+        yield {"index":"test", "sourcetype":"crime", "source":"witness",
+               "event":{"crime_number":i, "action":"success", "notes":[{"line":n, "text":"the butler did it"} for n in range(20)], "empty":None}}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    workerCounts = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) > 2 else [0, 2, 4]
+    with StubHEC() as hec:
+        for workers in workerCounts:
+            collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+            collector.serializer = _stdlib_dumps
+            collector.popNullFields = True
+            if workers:
+                collector.enableProcessPool(workers)
+            hec.reset()
+            start = time.time()
+            collector.sendStream(events(count))
+            elapsed = time.time() - start
+            label = "%d worker processes" % workers if workers else "calling thread"
+            print("%-20s %10.1f events/s events received %d" % (label, count / elapsed, hec.events))
+
+
+if __name__ == "__main__":
+    main()
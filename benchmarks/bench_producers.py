@@ -0,0 +1,52 @@
+"""bench_producers.py
+    Stress run of batchEvent with many producer threads sharing one collector.
+
+    Checks that every event reaches the stub HEC and reports aggregate producer events per second.
+
+    Usage:
+        python benchmarks/bench_producers.py [producer_threads] [events_per_thread]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector
+from stub_hec import StubHEC
+
+
+def main():
+    producers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    perThread = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    expected = producers * perThread
+
+    with StubHEC() as hec:
+        collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+
+        def producer(producerId):
+            for i in range(perThread):
+                collector.batchEvent({"event":{"action":"success","producer":producerId,"event_id":i}})
+
+        threads = [threading.Thread(target=producer, args=(x,)) for x in range(producers)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        produced = time.time() - start
+        collector.flushBatch()
+        delivered = time.time() - start
+
+        print("producers=%d events=%d received=%d batches=%d" % (producers, expected, hec.events, hec.requests))
+        print("producer rate %10.1f events/s" % (expected / produced))
+        print("delivered rate %9.1f events/s" % (expected / delivered))
+        if hec.events != expected:
+            print("LOST %d events" % (expected - hec.events))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
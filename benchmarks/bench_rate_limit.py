@@ -0,0 +1,61 @@
+"""bench_rate_limit.py
+    Cost and effect of rate limits, sampling and duplicate collapsing on batchEvent.
+
+    A noisy source repeats the same few events. Each run reports CPU microseconds per batchEvent call on the
+    producing thread (thread_time, so sender threads are not counted), and the events and bytes the stub received.
+
+    Usage:
+        python benchmarks/bench_rate_limit.py [events]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector
+from stub_hec import StubHEC
+
+
+def payloads(count):
+    for i in range(count):
+        yield {"index":"test", "sourcetype":"crime", "source":"witness", "host":"mansion",
+               "event":{"killer":"Professor Plum", "weapon":"rope", "location":"library", "alarm":i % 5}}
+
+
+def run(label, hec, count, configure):
+    collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+    collector.log.setLevel('CRITICAL')
+    configure(collector)
+    hec.reset()
+    start = time.thread_time()
+    for payload in payloads(count):
+        collector.batchEvent(payload)
+    elapsed = time.thread_time() - start
+    collector.close()
+    stats = collector.stats()
+    print("%-18s %7.2f us/event  received %7d events %9d bytes  sampled out %d rate dropped %d collapsed %d" % (
+        label, elapsed / count * 1e6, hec.events, hec.bytes,
+        stats['events_sampled_out'], stats['events_rate_dropped'], stats['events_collapsed']))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with StubHEC() as hec:
+        run('unlimited', hec, count, lambda c: None)
+        run('limit, not hit', hec, count, lambda c: c.setRateLimit(eventsPerSecond=10**9, bytesPerSecond=10**12))
+
+        def dropOver(c):
+            c.rateLimitPolicy = 'drop'
+            c.setRateLimit(eventsPerSecond=1000, sourcetype='crime')
+        run('drop over 1000/s', hec, count, dropOver)
+        run('sample 0.1', hec, count, lambda c: c.setSampling(0.1))
+
+        def collapse(c):
+            c.dedupWindow = 10
+        run('dedup', hec, count, collapse)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""bench_serializers.py
+    Compare JSON serializer backends on the example.py "crime" events.
+
+    Backends that are not installed are skipped.
+
+    Usage:
+        python benchmarks/bench_serializers.py [events]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import splunk_http_event_collector
+
+
+def commitCrime():
+
+    # list of sample values, same as example.py
+    suspects = ['Miss Scarett','Professor Plum','Miss Peacock','Mr. Green','Colonel Mustard','Mrs. White']
+    weapons = ['candlestick','knife','lead pipe','revolver','rope','wrench']
+    rooms = ['kitchen','ballroom','conservatory','dining room','cellar','billiard room','library','lounge','hall','study']
+
+    return {"killer":random.choice(suspects), "weapon":random.choice(weapons), "location":random.choice(rooms), "victim":"Mr Boddy"}
+
+
+def backends():
+    found = [('json', splunk_http_event_collector._stdlib_dumps)]
+    try:
+        import ujson
+        found.append(('ujson', lambda payload: ujson.dumps(payload, escape_forward_slashes=False, ensure_ascii=True)))
+    except ImportError:
+        pass
+    try:
+        import orjson
+        found.append(('orjson', lambda payload: orjson.dumps(payload, default=str, option=splunk_http_event_collector._orjson_options)))
+        found.append(('orjson backend', splunk_http_event_collector._orjson_dumps))
+    except ImportError:
+        pass
+    return found
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payloads = []
+    for i in range(count):
+        event = commitCrime()
+        event.update({"action":"success", "crime_type":"batch", "crime_number":i, "witness_id":uuid.uuid4(), "reported":datetime.datetime.now()})
+        payloads.append({"index":"test", "sourcetype":"crime", "source":"witness", "host":"mansion", "time":str(round(time.time(),3)), "event":event})
+
+    print("default backend: %s" % splunk_http_event_collector.json_backend)
+    for name, dumps in backends():
+        start = time.perf_counter()
+        for payload in payloads:
+            dumps(payload)
+        elapsed = time.perf_counter() - start
+        print("%-14s %12.1f events/s %8.3f us/event" % (name, count / elapsed, elapsed / count * 1e6))
+
+
+if __name__ == "__main__":
+    main()
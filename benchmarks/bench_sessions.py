@@ -0,0 +1,53 @@
+"""bench_sessions.py
+    Requests per second against a local stub HEC: a new Session per post versus the pooled keep-alive session.
+
+    Usage:
+        python benchmarks/bench_sessions.py [requests_per_thread]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector
+from stub_hec import StubHEC
+
+PAYLOAD = '{"event":{"action":"success","message":"hello world"},"host":"bench","time":"0"}'
+
+
+def run(collector, hec, perThread, pooled):
+    """Post perThread requests from threadCount threads and return (requests/s, tcp connections)."""
+
+    def worker():
+        for i in range(perThread):
+            if pooled:
+                session = collector.session
+            else:
+                session = collector.requests_retry_session()
+            session.post(collector.server_uri, data=PAYLOAD, headers={'Authorization':'Splunk '+collector.token})
+
+    hec.reset()
+    threads = [threading.Thread(target=worker) for x in range(collector.threadCount)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    return (hec.requests / elapsed, hec.connections)
+
+
+def main():
+    perThread = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with StubHEC() as hec:
+        collector = http_event_collector("bench-token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+        for label, pooled in (('session per post', False), ('pooled session', True)):
+            rate, connections = run(collector, hec, perThread, pooled)
+            print("%-18s %10.1f req/s %6d connections" % (label, rate, connections))
+
+
+if __name__ == "__main__":
+    main()
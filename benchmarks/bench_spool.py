@@ -0,0 +1,48 @@
+"""bench_spool.py
+    Disk spool write and replay throughput for batches of maxByteLength bytes.
+
+    Usage:
+        python benchmarks/bench_spool.py [batches] [spool_directory]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from splunk_http_event_collector import http_event_collector, _disk_spool
+
+
+def main():
+    batches = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    directory = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix='hec-spool-')
+    event = b'{"event":{"action":"success","killer":"Professor Plum","weapon":"rope"},"host":"bench","time":"0"} '
+    body = event * (http_event_collector.maxByteLength // len(event))
+    eventCount = body.count(b'} ')
+    totalMB = batches * len(body) / 1048576.0
+
+    try:
+        spool = _disk_spool(directory, maxBytes=batches * len(body) * 2, segmentBytes=16*1024*1024)
+        start = time.time()
+        for i in range(batches):
+            spool.append(body, eventCount)
+        elapsed = time.time() - start
+        print("write  %8.1f batches/s %8.1f MB/s" % (batches / elapsed, totalMB / elapsed))
+
+        start = time.time()
+        replayed = events = 0
+        while spool.segments:
+            for data, count, destination in spool.takeOldest():
+                replayed += 1
+                events += count
+        elapsed = time.time() - start
+        print("replay %8.1f batches/s %8.1f MB/s (%d batches, %d events)" % (replayed / elapsed, totalMB / elapsed, replayed, events))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""bench_startup.py
+    Import time, construction time and threads of idle collectors, e.g. one collector per sourcetype.
+
+    Sender threads and the requests stack are only started on first use, so idle collectors cost no threads.
+
+    Usage:
+        python benchmarks/bench_startup.py [collectors]
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    start = time.perf_counter()
+    from splunk_http_event_collector import http_event_collector
+    print("import                 %8.1f ms, requests imported: %s" % ((time.perf_counter() - start) * 1000, 'requests' in sys.modules))
+
+    threads = threading.active_count()
+    start = time.perf_counter()
+    collectors = [http_event_collector("bench-token", "127.0.0.1", http_event_server_ssl=False) for x in range(count)]
+    elapsed = time.perf_counter() - start
+    print("%d idle collectors     %8.1f ms, threads started %d, peak RSS %.1f MB" % (count, elapsed * 1000, threading.active_count() - threads, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""stub_hec.py
+    Lightweight local stand-in for a Splunk HTTP Event Collector used by the benchmarks.
+
+    Speaks /services/collector/event, /services/collector/raw, /services/collector/ack and
+    /services/collector/health over keep-alive HTTP/1.1 and accepts gzip request bodies.
+    Latency, 503 busy responses and connection resets can be injected to exercise the client.
+    Nothing is indexed; only request, byte and event counts are kept.
+
+    Run standalone:
+        python benchmarks/stub_hec.py --port 8088 --latency 0.005 --busy-rate 0.01 --reset-rate 0.001
+"""
+
+import argparse
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+SUCCESS_BODY = b'{"text":"Success","code":0}'
+BUSY_BODY = b'{"text":"Server is busy","code":9}'
+HEALTHY_BODY = b'{"text":"HEC is healthy","code":17}'
+
+
+def _count_events(body, raw):
+    """Count events in a HEC body: lines for /raw, concatenated JSON objects for /event."""
+
+    if raw:
+        return body.count(b'\n')
+    text = body.decode('utf-8')
+    decoder = json.JSONDecoder()
+    count = 0
+    index = 0
+    while True:
+        while index < len(text) and text[index].isspace():
+            index += 1
+        if index >= len(text):
+            return count
+        obj, index = decoder.raw_decode(text, index)
+        count += 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so headers and body leave in one segment on keep-alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.startswith('/services/collector/health'):
+            self._reply(200, HEALTHY_BODY)
+        else:
+            self._reply(404, b'{"text":"Not Found","code":404}')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        server = self.server
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.resetRate and random.random() < server.resetRate:
+            self._reset()
+            return
+        if server.busyRate and random.random() < server.busyRate:
+            server.record(0, busy=True)
+            self._reply(503, BUSY_BODY)
+            return
+
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 47)
+        if self.path.startswith('/services/collector/ack'):
+            acks = json.loads(body.decode('utf-8')).get('acks', [])
+            self._reply(200, json.dumps({'acks':dict((str(ackId), True) for ackId in acks)}).encode('utf-8'))
+            return
+        if self.path.startswith('/services/collector/health'):
+            self._reply(200, HEALTHY_BODY)
+            return
+
+        server.record(len(body), _count_events(body, '/raw' in self.path))
+        if server.ack:
+            self._reply(200, json.dumps({'text':'Success', 'code':0, 'ackId':server.nextAckId()}).encode('utf-8'))
+        else:
+            self._reply(200, SUCCESS_BODY)
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reset(self):
+        # SO_LINGER with a zero timeout makes close() send a TCP RST instead of a FIN
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self.server.record(0, reset=True)
+        self.close_connection = True
+        self.connection.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHEC(ThreadingMixIn, HTTPServer):
+
+    """
+        Threaded stub HEC listening on 127.0.0.1.
+
+        Keyword Arguments:
+            port -- port to listen on (default 0, any free port, see the port property)
+            ack -- return an ackId for every post and report every ackId as indexed (default False)
+            latency -- seconds to sleep before answering each post (default 0)
+            busyRate -- fraction of posts answered with 503 Server is busy (default 0)
+            resetRate -- fraction of posts answered by resetting the connection (default 0)
+
+        Example:
+            with StubHEC(latency=0.005) as hec:
+                collector = http_event_collector("token", "127.0.0.1", http_event_port=hec.port, http_event_server_ssl=False)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, ack=False, latency=0, busyRate=0, resetRate=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), _StubHandler)
+        self.ack = ack
+        self.latency = latency
+        self.busyRate = busyRate
+        self.resetRate = resetRate
+        self._ackId = 0
+        self._countLock = threading.Lock()
+        self.reset()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def process_request(self, request, client_address):
+        with self._countLock:
+            self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def nextAckId(self):
+        with self._countLock:
+            self._ackId += 1
+            return self._ackId
+
+    def record(self, byteCount, eventCount=0, busy=False, reset=False):
+        with self._countLock:
+            if busy:
+                self.busy += 1
+            elif reset:
+                self.resets += 1
+            else:
+                self.requests += 1
+                self.bytes += byteCount
+                self.events += eventCount
+
+    def reset(self):
+        with self._countLock:
+            self.requests = 0
+            self.bytes = 0
+            self.events = 0
+            self.connections = 0
+            self.busy = 0
+            self.resets = 0
+
+    def __enter__(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in Splunk HEC receiver for benchmarks.")
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--ack', action='store_true', help="hand out ackIds and acknowledge them")
+    parser.add_argument('--latency', type=float, default=0, help="seconds added to every post")
+    parser.add_argument('--busy-rate', type=float, default=0, help="fraction of posts answered with 503")
+    parser.add_argument('--reset-rate', type=float, default=0, help="fraction of posts answered with a connection reset")
+    args = parser.parse_args()
+
+    hec = StubHEC(args.port, ack=args.ack, latency=args.latency, busyRate=args.busy_rate, resetRate=args.reset_rate)
+    print("stub HEC listening on 127.0.0.1:%d" % hec.port)
+    try:
+        hec.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("requests=%d events=%d bytes=%d busy=%d resets=%d connections=%d" % (hec.requests, hec.events, hec.bytes, hec.busy, hec.resets, hec.connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 
 import sys
 if sys.version_info < (2,7):
@@ -18,11 +21,15 @@ setup(name='Splunk-HEC',
       author='George (starcher) Starcher',
       author_email='george@georgestarcher.com',
       url='https://github.com/georgestarcher/Splunk-Class-httpevent',
-      py_modules=['splunk_http_event_collector'],
+      py_modules=['splunk_http_event_collector', 'splunk_http_event_collector_async', 'splunk_hec_forward'],
+      entry_points={
+          'console_scripts': ['splunk-hec-forward=splunk_hec_forward:main'],
+      },
       keywords="splunk hec",
       license="MIT",
       install_requires=[
-          'requests'
+          'requests',
+          'futures; python_version < "3"'
       ],
      )
 
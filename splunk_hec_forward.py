@@ -0,0 +1,397 @@
+"""splunk_hec_forward.py
+    splunk-hec-forward: tail log files and forward new lines to a Splunk HTTP Event Collector raw endpoint.
+
+    Files are read in large chunks and cut into batches at newline boundaries, so lines are never split
+    one at a time in Python. Byte offsets are checkpointed only once the batches holding them were accepted
+    by HEC, so a restart neither loses nor re-sends delivered data. Batches still in flight when the process
+    is killed are sent again on restart.
+
+    Usage:
+        splunk-hec-forward --server localhost --sourcetype syslog "/var/log/messages*" /var/log/secure
+        python -m splunk_hec_forward --help
+
+    Remember: Friends don't let friends send in non Common Information Model data: http://docs.splunk.com/Documentation/CIM/latest/User/Overview
+        Please use CIM friendly field names when sending in data.
+"""
+
+__author__ = "george@georgestarcher.com (George Starcher)"
+
+import argparse
+import collections
+import glob
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from splunk_http_event_collector import http_event_collector, _batch_buffer
+
+try:
+    _replace = os.replace
+except AttributeError:
+    # Python 2 has no os.replace. os.rename overwrites atomically on POSIX, on Windows the old file has to go first.
+    def _replace(source, target):
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+
+
+class _tailed_file:
+
+    """Internal Class: one open file being forwarded, tracked by device and inode so renames keep their offsets."""
+
+    def __init__(self, path, handle, key, offset):
+        self.path = path
+        self.handle = handle
+        self.key = key
+        # next byte to read, and the end of the contiguous range confirmed delivered
+        self.readOffset = offset
+        self.delivered = offset
+        # [start, end, body, eventCount, future, retryAt] per batch in flight, in file order. body is the one
+        # buffer both queued for sending and kept for resends.
+        # future is None once HEC rejected the batch for good.
+        self.pending = collections.deque()
+        self.pendingBytes = 0
+        self.unmatchedAt = None
+
+
+class file_forwarder:
+
+    """
+        Tails files matching glob patterns and forwards complete lines in raw batches through an http_event_collector.
+
+        Keyword Arguments:
+            collector -- a raw http_event_collector - required
+            patterns -- list of file paths or glob patterns - required
+            checkpointPath -- JSON file holding delivered byte offsets - required
+            fields -- optional dict of index, sourcetype and host for every batch, source defaults to the file path
+
+        Attributes:
+            chunkBytes -- bytes read from a file at a time (default 4MB)
+            maxPendingBytes -- bytes read but not yet delivered, across all files, above which reading pauses until HEC catches up (default 64MB).
+                               Memory use is bounded by about twice this plus one chunk, whatever the backlog on disk.
+            pollInterval -- seconds to sleep when no file has new data (default 0.5)
+            discoverInterval -- seconds between glob scans for new, rotated and removed files (default 1)
+            checkpointInterval -- seconds between checkpoint writes (default 1)
+            retryInterval -- seconds before a failed batch is sent again (default 5)
+            rotateWait -- seconds a file no longer matched by the patterns, e.g. rotated away, is still read before it is closed (default 5)
+            startAtEnd -- boolean flag to skip existing content of files without a checkpoint found by the first scan (default false).
+                          Files appearing later, e.g. the new file after a rotation, are always read from the start.
+            rejected -- count of batches HEC refused with a 4xx other than 408 and 429, logged, dropped and skipped past
+
+        Rotation by rename is followed through the inode: the old file is read to its end, and if it still
+        matches a pattern (e.g. "app.log*") it is simply tailed under its new name. A file that shrinks below
+        its read offset is treated as truncated (copytruncate) and read again from the start.
+    """
+
+    def __init__(self, collector, patterns, checkpointPath, fields=None):
+        self.log = logging.getLogger(u'HEC.forward')
+        self.collector = collector
+        self.patterns = patterns
+        self.checkpointPath = checkpointPath
+        self.fields = fields or {}
+        self.chunkBytes = 4*1024*1024
+        self.maxPendingBytes = 64*1024*1024
+        self.pollInterval = 0.5
+        self.discoverInterval = 1.0
+        self.checkpointInterval = 1.0
+        self.retryInterval = 5.0
+        self.rotateWait = 5.0
+        self.startAtEnd = False
+        self.rejected = 0
+        self.files = {}
+        self.checkpoint = self._loadCheckpoint()
+        self._lastDiscover = 0
+        self._discovered = False
+        self._lastCheckpoint = 0
+        self._running = True
+
+    def _loadCheckpoint(self):
+        """Internal Function: Read saved offsets, keyed by "device:inode"."""
+
+        try:
+            with open(self.checkpointPath) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            self.log.warn("Checkpoint file %s is not valid JSON, starting without it.",self.checkpointPath)
+            return {}
+
+    def saveCheckpoint(self):
+        """Method to write the delivered offset of every tracked file, atomically replacing the checkpoint file."""
+
+        self.checkpoint = dict((f.key, {'path':f.path, 'offset':f.delivered}) for f in self.files.values())
+        temp = self.checkpointPath + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.checkpoint, f)
+        _replace(temp, self.checkpointPath)
+        self._lastCheckpoint = time.time()
+
+    def _discover(self):
+        """Internal Function: Open files newly matched by the patterns and note tracked files that no longer match."""
+
+        matched = set()
+        for pattern in self.patterns:
+            for path in sorted(glob.glob(pattern)):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                key = '%d:%d' % (st.st_dev, st.st_ino)
+                matched.add(key)
+                if key in self.files:
+                    continue
+                saved = self.checkpoint.get(key)
+                if saved is not None and saved['offset'] <= st.st_size:
+                    offset = saved['offset']
+                elif saved is None and self.startAtEnd and not self._discovered:
+                    offset = st.st_size
+                else:
+                    offset = 0
+                try:
+                    handle = open(path, 'rb')
+                except (IOError, OSError) as e:
+                    self.log.warn("Cannot open %s: %s",path,e)
+                    continue
+                self.log.info("Forwarding %s from offset %s.",path,offset)
+                self.files[key] = _tailed_file(path, handle, key, offset)
+
+        now = time.time()
+        for key, tailed in self.files.items():
+            if key in matched:
+                tailed.unmatchedAt = None
+            elif tailed.unmatchedAt is None:
+                self.log.info("%s was rotated or removed, reading it to the end.",tailed.path)
+                tailed.unmatchedAt = now
+        self._lastDiscover = now
+        self._discovered = True
+
+    def _readAvailable(self, tailed):
+        """Internal Function: Read new complete lines from one file and queue them as batches. Returns True if data was read."""
+
+        size = os.fstat(tailed.handle.fileno()).st_size
+        if size < tailed.readOffset:
+            self.log.warn("%s was truncated, reading it again from the start.",tailed.path)
+            # batches of the old content still in flight are delivered but no longer move the checkpoint
+            tailed.pending.clear()
+            tailed.pendingBytes = 0
+            tailed.readOffset = tailed.delivered = 0
+        if size == tailed.readOffset:
+            return False
+
+        tailed.handle.seek(tailed.readOffset)
+        data = tailed.handle.read(min(self.chunkBytes, size - tailed.readOffset))
+        end = data.rfind(b'\n') + 1
+        if not end:
+            if len(data) < self.chunkBytes:
+                # partial last line, wait for the writer to finish it
+                return False
+            # a single line longer than chunkBytes is sent as it is
+            end = len(data)
+        self._queueLines(tailed, data, end)
+        return True
+
+    def _queueLines(self, tailed, data, end):
+        """Internal Function: Cut data[:end] into batches of whole lines within maxByteLength and queue them."""
+
+        maxByteLength = self.collector._batchByteLimit()
+        destination = dict(self.fields)
+        destination.setdefault('source', tailed.path)
+        view = memoryview(data)
+        start = 0
+        # each batch is copied once into the buffer that is queued, so the chunk itself is not kept alive by pending batches
+        while start < end:
+            stop = start + maxByteLength
+            if stop < end:
+                cut = data.rfind(b'\n', start, stop) + 1
+                if cut <= start:
+                    # one line longer than maxByteLength, send it alone
+                    cut = data.find(b'\n', stop) + 1 or end
+                stop = min(cut, end)
+            else:
+                stop = end
+            eventCount = data.count(b'\n', start, stop) or 1
+            body = _batch_buffer(view[start:stop])
+            future = self.collector.sendBatchAsync(body, eventCount, destination)
+            tailed.pending.append([tailed.readOffset + start, tailed.readOffset + stop, body, eventCount, future, 0])
+            start = stop
+        tailed.readOffset += end
+        tailed.pendingBytes += end
+
+    def _settle(self, tailed):
+        """
+        Internal Function: Resend failed batches and advance the delivered offset over the contiguous delivered ones.
+
+        Batches HEC rejects with a 4xx other than 408 and 429 would fail again however often they are resent, e.g.
+        an unknown index, so they are dropped and counted in rejected instead of holding the checkpoint back forever.
+        """
+
+        now = time.time()
+        for entry in tailed.pending:
+            future = entry[4]
+            if future is None or not future.done():
+                continue
+            status = self._status(future)
+            if status == 200:
+                continue
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                self.log.error("HEC rejected a batch of %s lines from %s (bytes %s-%s) with status %s, dropping it.",entry[3],tailed.path,entry[0],entry[1],status)
+                self.rejected += 1
+                entry[2] = entry[4] = None
+                continue
+            if not entry[5]:
+                self.log.warn("Batch of %s lines from %s failed, resending in %s seconds.",entry[3],tailed.path,self.retryInterval)
+                entry[5] = now + self.retryInterval
+            elif now >= entry[5]:
+                destination = dict(self.fields)
+                destination.setdefault('source', tailed.path)
+                entry[4] = self.collector.sendBatchAsync(entry[2], entry[3], destination)
+                entry[5] = 0
+
+        while tailed.pending and self._settled(tailed.pending[0][4]):
+            start, tailed.delivered = tailed.pending.popleft()[:2]
+            tailed.pendingBytes -= tailed.delivered - start
+
+    @staticmethod
+    def _status(future):
+        """Internal Function: HTTP status of a finished batch, None if the post failed."""
+
+        if future.exception() is not None:
+            return None
+        response = future.result()
+        return response.status_code if response is not None else None
+
+    def _settled(self, future):
+        """Internal Function: True once a batch was delivered or rejected for good (future None)."""
+
+        return future is None or (future.done() and self._status(future) == 200)
+
+    def _closeFinished(self, tailed, now):
+        """Internal Function: Close a file no longer matched by the patterns once it is read, delivered and rotateWait has passed."""
+
+        if tailed.unmatchedAt is None or now - tailed.unmatchedAt < self.rotateWait or tailed.pending:
+            return False
+        if os.fstat(tailed.handle.fileno()).st_size > tailed.readOffset:
+            # a last line without a newline is sent before the file is let go
+            tailed.handle.seek(tailed.readOffset)
+            data = tailed.handle.read() + b'\n'
+            self._queueLines(tailed, data, len(data))
+            # the added newline is not part of the file
+            tailed.readOffset -= 1
+            return False
+        self.log.info("Finished %s.",tailed.path)
+        tailed.handle.close()
+        del self.files[tailed.key]
+        return True
+
+    def stop(self, *args):
+        """Method to stop run() after the current pass, e.g. from a signal handler."""
+
+        self._running = False
+
+    def pendingBytes(self):
+        """Method returning the bytes read from all files that are not delivered yet."""
+
+        return sum(tailed.pendingBytes for tailed in self.files.values())
+
+    def busy(self):
+        """Method returning True while any batch is still waiting for delivery."""
+
+        return any(tailed.pending for tailed in self.files.values())
+
+    def run(self, once=False, shutdownTimeout=30):
+        """
+        Method to forward until stop() is called, or with once=True until every file is read to its end and delivered.
+
+        On the way out it waits up to shutdownTimeout seconds for batches in flight, then writes the checkpoint.
+        """
+
+        try:
+            while self._running:
+                now = time.time()
+                if now - self._lastDiscover >= self.discoverInterval:
+                    self._discover()
+                moved = False
+                paused = False
+                # stop reading while too much is in flight, e.g. HEC is down, so memory does not grow with the backlog
+                for tailed in list(self.files.values()):
+                    if self.pendingBytes() < self.maxPendingBytes:
+                        moved = self._readAvailable(tailed) or moved
+                    else:
+                        paused = True
+                    self._settle(tailed)
+                    self._closeFinished(tailed, now)
+                if now - self._lastCheckpoint >= self.checkpointInterval:
+                    self.saveCheckpoint()
+                if once and not moved and not paused and not self.busy():
+                    break
+                if paused:
+                    # resume reading as soon as deliveries make room
+                    time.sleep(0.05)
+                elif not moved:
+                    time.sleep(self.pollInterval)
+        finally:
+            deadline = time.time() + shutdownTimeout
+            while self.busy() and time.time() < deadline:
+                for tailed in list(self.files.values()):
+                    self._settle(tailed)
+                time.sleep(0.05)
+            self.saveCheckpoint()
+            if self.rejected:
+                self.log.warn("%s batches were rejected by HEC and dropped, see the errors above.",self.rejected)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='splunk-hec-forward', description="Tail files and forward new lines to a Splunk HEC raw endpoint.")
+    parser.add_argument('paths', nargs='+', help="files or glob patterns, quote globs so the shell leaves them alone")
+    parser.add_argument('--server', required=True, help="HEC server, or a comma separated list of server[:port] to load balance")
+    parser.add_argument('--port', default='8088')
+    parser.add_argument('--token', default=os.environ.get('SPLUNK_HEC_TOKEN'), help="HEC token (default $SPLUNK_HEC_TOKEN)")
+    parser.add_argument('--no-ssl', action='store_true', help="HEC is plain http")
+    parser.add_argument('--index')
+    parser.add_argument('--sourcetype')
+    parser.add_argument('--host', help="host field (default the local hostname)")
+    parser.add_argument('--checkpoint', default='splunk-hec-forward.checkpoint', help="file holding delivered offsets")
+    parser.add_argument('--start-at-end', action='store_true', help="skip existing content of files found at startup without a checkpoint")
+    parser.add_argument('--once', action='store_true', help="exit once every file is read to its end and delivered")
+    parser.add_argument('--chunk-bytes', type=int, default=4*1024*1024)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--max-pending-bytes', type=int, default=64*1024*1024, help="read data not yet delivered above which reading pauses")
+    parser.add_argument('--compress', action='store_true', help="gzip batch bodies")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S %z')
+    if not args.token:
+        parser.error("a HEC token is required, pass --token or set SPLUNK_HEC_TOKEN")
+
+    servers = args.server.split(',')
+    collector = http_event_collector(args.token, servers if len(servers) > 1 else servers[0], input_type='raw', host=args.host or "", http_event_port=args.port, http_event_server_ssl=not args.no_ssl)
+    collector.compressBatches = args.compress
+    logging.getLogger(u'HEC').setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    fields = {'host':collector.host}
+    if args.index:
+        fields['index'] = args.index
+    if args.sourcetype:
+        fields['sourcetype'] = args.sourcetype
+
+    forwarder = file_forwarder(collector, args.paths, args.checkpoint, fields)
+    forwarder.chunkBytes = args.chunk_bytes
+    forwarder.pollInterval = args.poll_interval
+    forwarder.maxPendingBytes = args.max_pending_bytes
+    forwarder.startAtEnd = args.start_at_end
+    signal.signal(signal.SIGTERM, forwarder.stop)
+    try:
+        forwarder.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
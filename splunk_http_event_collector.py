@@ -7,24 +7,554 @@
 
 __author__ = "george@georgestarcher.com (George Starcher)"
 
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-
+import atexit
+import collections
+import copy
+import hashlib
 import json
+import os
+import random
+import struct
 import time
 import socket
 import threading
 import uuid
 import sys
+import zlib
 
 import logging
 
 is_py2 = sys.version[0] == '2'
 if is_py2:
     import Queue as Queue
+    from urllib import quote
 else:
     import queue as Queue
+    from urllib.parse import quote
+
+# concurrent.futures is standard on Python 3, Python 2 has it from the futures backport (installed by setup.py).
+# Without it sendEvent falls back to a minimal Future and enableProcessPool is unavailable.
+try:
+    from concurrent.futures import Future, ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+    class Future(object):
+
+        """Minimal stand-in for concurrent.futures.Future: result, exception, done, set_result and set_exception."""
+
+        def __init__(self):
+            self._done = threading.Event()
+            self._result = None
+            self._exception = None
+
+        def done(self):
+            return self._done.is_set()
+
+        def set_result(self, result):
+            self._result = result
+            self._done.set()
+
+        def set_exception(self, exception):
+            self._exception = exception
+            self._done.set()
+
+        def exception(self, timeout=None):
+            self._done.wait(timeout)
+            return self._exception
+
+        def result(self, timeout=None):
+            if not self._done.wait(timeout):
+                raise RuntimeError("timed out waiting for the Future")
+            if self._exception is not None:
+                raise self._exception
+            return self._result
+
+# Fastest available JSON backend for event serialization: orjson, then ujson, then the standard library.
+# Every backend falls back to json.dumps(default=str) for payloads it cannot encode, so datetimes,
+# UUIDs and other objects still render with str() as before.
+# orjson returns UTF-8 bytes, which go into the bytearray batches without a decode and re-encode.
+def _stdlib_dumps(payload):
+    return json.dumps(payload, default=str)
+
+try:
+    import orjson
+    _orjson_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def _orjson_dumps(payload):
+        try:
+            return orjson.dumps(payload, default=str, option=_orjson_options)
+        except TypeError:
+            return _stdlib_dumps(payload).encode('utf-8')
+    json_backend = 'orjson'
+    _json_dumps = _orjson_dumps
+except ImportError:
+    try:
+        import ujson
+
+        def _ujson_dumps(payload):
+            try:
+                return ujson.dumps(payload, escape_forward_slashes=False, ensure_ascii=True)
+            except (TypeError, OverflowError):
+                return _stdlib_dumps(payload)
+        json_backend = 'ujson'
+        _json_dumps = _ujson_dumps
+    except ImportError:
+        json_backend = 'json'
+        _json_dumps = _stdlib_dumps
+
+def _requests_modules():
+    """requests, HTTPAdapter and Retry, imported when the first session is built so importing this module and creating collectors stays cheap."""
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.util.retry import Retry
+    return requests, HTTPAdapter, Retry
+
+# Per thread CPU clock for compression timing, falls back to wall clock where unavailable
+_cpu_clock = getattr(time, 'thread_time', time.time)
+# High resolution clock for serialization and post timing
+_perf_clock = getattr(time, 'perf_counter', time.time)
+
+# Upper bounds in milliseconds of the POST latency histogram buckets used for percentiles
+_latency_buckets_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float('inf'))
+
+
+def _to_bytes(payloadString):
+    """UTF-8 bytes of a serialized event, serializers may return either str or bytes."""
+
+    if isinstance(payloadString, bytes):
+        return payloadString
+    return payloadString.encode('utf-8')
+
+
+class _batch_buffer(bytearray):
+
+    """
+        Internal Class: batch body built directly as encoded bytes.
+
+        Events are appended already UTF-8 encoded, so len() is the exact request size checked against
+        maxByteLength, and the buffer itself is posted without another join or encode.
+        Carries its event count, start time and, for raw destinations, the index/sourcetype/source/host query parameters.
+        future is set for batches whose sender waits on the HTTP response.
+    """
+
+    future = None
+
+    def __init__(self, data=b'', destination=None, eventCount=0):
+        bytearray.__init__(self, data)
+        self.eventCount = eventCount
+        self.destination = destination
+        self.started = 0
+
+    def add(self, data):
+        self.extend(data)
+        self.eventCount += 1
+
+
+class _single_event(_batch_buffer):
+
+    """Internal Class: one event queued by sendEvent, carrying the Future resolved with its own HTTP response."""
+
+    def __init__(self, data, destination=None):
+        _batch_buffer.__init__(self, data, destination, 1)
+        self.future = Future()
+
+
+def _build_batch_bodies(payloads, isJson, popNullFields, host, serializer, maxByteLength, maxEvents):
+    """
+    Serialize a chunk of payloads into complete batch bodies, run in the enableProcessPool worker processes.
+
+    Applies the same host, time and popNullFields handling as batchEvents. Returns (batches, serializeSeconds),
+    batches being a list of _batch_buffer each within maxByteLength and maxEvents.
+    """
+
+    start = _perf_clock()
+    batches = []
+    batch = _batch_buffer()
+    lastTime = None
+    timeString = ""
+    for payload in payloads:
+        if isJson:
+            if 'host' not in payload:
+                payload['host'] = host
+            if 'time' not in payload:
+                now = round(time.time(),3)
+                if now != lastTime:
+                    lastTime = now
+                    timeString = str(now)
+                payload['time'] = timeString
+            if popNullFields:
+                payloadEvent = payload.get('event')
+                payload['event'] = {k:v for k,v in payloadEvent.items() if v}
+            data = _to_bytes(serializer(payload))
+        else:
+            data = str(payload).encode('utf-8')
+            if not data.endswith(b"\n"):
+                data = data+b"\n"
+
+        if batch and (len(batch)+len(data) > maxByteLength or (maxEvents and batch.eventCount >= maxEvents)):
+            batches.append(batch)
+            batch = _batch_buffer()
+        batch.add(data)
+    if batch:
+        batches.append(batch)
+    return (batches, _perf_clock() - start)
+
+
+class _send_queue(Queue.Queue):
+
+    """Internal Class: flushQueue that puts single sendEvent items ahead of queued batches, in the order they were sent."""
+
+    def _init(self, maxsize):
+        Queue.Queue._init(self, maxsize)
+        self.singles = collections.deque()
+
+    def _qsize(self, len=len):
+        return len(self.queue) + len(self.singles)
+
+    def _put(self, item):
+        if isinstance(item, _single_event):
+            self.singles.append(item)
+        else:
+            self.queue.append(item)
+
+    def _get(self):
+        if self.singles:
+            return self.singles.popleft()
+        return self.queue.popleft()
+
+    def takeOldestBatch(self):
+        """Remove and return the oldest queued batch, skipping single sendEvent items and stop markers. Returns None if there is none."""
+
+        with self.mutex:
+            for index, item in enumerate(self.queue):
+                if item is not None:
+                    del self.queue[index]
+                    self.not_full.notify()
+                    return item
+        return None
+
+
+def _histogram_percentile(counts, fraction):
+    """Upper bucket bound in milliseconds below which fraction of the recorded latencies fall."""
+
+    total = sum(counts)
+    if not total:
+        return 0.0
+    threshold = fraction * total
+    seen = 0
+    for bound, count in zip(_latency_buckets_ms, counts):
+        seen += count
+        if seen >= threshold:
+            return bound
+    return _latency_buckets_ms[-1]
+
+class _disk_spool:
+
+    """
+        Internal Class: append-only on-disk spool of batch bodies.
+
+        Batches are written as records to numbered segment files of about segmentBytes. Each record is a header of
+        two lengths, a small JSON of the batch event count and raw destination, then the body.
+        Once the spool holds more than maxBytes the oldest segments are deleted.
+        Segments left by a previous run are picked up again on start without reading them; their record counts
+        are only worked out when they are replayed or evicted. A segment that cannot be read is renamed to .bad and
+        left in the directory for inspection.
+    """
+
+    _header = struct.Struct('>II')
+
+    def __init__(self, directory, maxBytes, segmentBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.segmentBytes = segmentBytes
+        self.lock = threading.Lock()
+        self.spooled = 0
+        self.replayed = 0
+        self.evicted = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.segments = sorted(int(name.split('.')[0]) for name in os.listdir(directory) if name.endswith('.spool'))
+        self.sizes = dict((seq, os.path.getsize(self._path(seq))) for seq in self.segments)
+        # None until counted, for segments left by a previous run
+        self.counts = dict((seq, None) for seq in self.segments)
+        self.active = None
+
+    def _path(self, seq):
+        return os.path.join(self.directory, '%012d.spool' % seq)
+
+    @property
+    def byteSize(self):
+        return sum(self.sizes.values())
+
+    def append(self, data, eventCount, destination=None):
+        """Append one batch body (bytes or bytearray) with its event count and destination, rotating and evicting as needed."""
+
+        meta = json.dumps({'events':eventCount, 'destination':destination}).encode('utf-8')
+        with self.lock:
+            if self.active is None or self.sizes[self.segments[-1]] >= self.segmentBytes:
+                self._rotate()
+            self.active.write(self._header.pack(len(meta), len(data)))
+            self.active.write(meta)
+            self.active.write(data)
+            self.active.flush()
+            self.sizes[self.segments[-1]] += self._header.size + len(meta) + len(data)
+            self.counts[self.segments[-1]] += 1
+            self.spooled += 1
+            while len(self.segments) > 1 and self.byteSize > self.maxBytes:
+                self._evictOldest()
+
+    def _rotate(self):
+        if self.active is not None:
+            self.active.close()
+        seq = self.segments[-1] + 1 if self.segments else 1
+        self.segments.append(seq)
+        self.sizes[seq] = 0
+        self.counts[seq] = 0
+        self.active = open(self._path(seq), 'ab')
+
+    def _evictOldest(self):
+        seq = self.segments.pop(0)
+        count = self.counts.pop(seq)
+        self.evicted += count if count is not None else self._countRecords(self._path(seq))
+        del self.sizes[seq]
+        os.remove(self._path(seq))
+
+    def _countRecords(self, path):
+        """Count the complete records of a segment by seeking from header to header, without reading the bodies."""
+
+        size = os.path.getsize(path)
+        count = 0
+        offset = 0
+        with open(path, 'rb') as f:
+            while offset + self._header.size <= size:
+                f.seek(offset)
+                metaLength, length = self._header.unpack(f.read(self._header.size))
+                offset += self._header.size + metaLength + length
+                if offset > size:
+                    break
+                count += 1
+        return count
+
+    def _readRecords(self, path):
+        """Read a whole segment in one call and slice out its records as (body, eventCount, destination)."""
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        view = memoryview(data)
+        records = []
+        offset = 0
+        while offset + self._header.size <= len(data):
+            metaLength, length = self._header.unpack_from(data, offset)
+            offset += self._header.size
+            if offset + metaLength + length > len(data):
+                # torn write from a crash, keep what is complete
+                break
+            meta = json.loads(view[offset:offset+metaLength].tobytes().decode('utf-8'))
+            offset += metaLength
+            records.append((view[offset:offset+length].tobytes(), meta['events'], meta['destination']))
+            offset += length
+        return records
+
+    def takeOldest(self):
+        """
+        Remove the oldest segment and return its records, sealing the active segment if it is the only one.
+
+        The segment is only dropped once it has been read and deleted. One that cannot be read is moved aside
+        as .bad so it does not block the segments behind it, and the error is raised to the caller.
+        """
+
+        with self.lock:
+            if not self.segments:
+                return []
+            if len(self.segments) == 1 and self.active is not None:
+                self.active.close()
+                self.active = None
+            seq = self.segments[0]
+            path = self._path(seq)
+            try:
+                records = self._readRecords(path)
+            except Exception:
+                self._forget(seq)
+                if os.path.exists(path):
+                    os.rename(path, path + '.bad')
+                raise
+            os.remove(path)
+            self._forget(seq)
+            self.replayed += len(records)
+            return records
+
+    def _forget(self, seq):
+        self.segments.remove(seq)
+        del self.sizes[seq]
+        del self.counts[seq]
+
+
+class _rate_limit:
+
+    """
+        Internal Class: events/s and bytes/s token buckets plus deterministic sampling, for the collector or one sourcetype.
+
+        Buckets hold at most one second of tokens. Bytes are charged after serialization, so a bucket can run
+        into debt and the following events wait (or drop) until it refills, still before they are serialized.
+    """
+
+    def __init__(self):
+        self.events = None
+        self.bytes = None
+        self.sample = 1.0
+        self.eventTokens = 0.0
+        self.byteTokens = 0.0
+        self.last = time.time()
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def sampled(self):
+        """True if this event is kept. Keeps an even spread of exactly sample of the events, no randomness."""
+
+        if self.sample >= 1.0:
+            return True
+        with self.lock:
+            self.seen += 1
+            return int(self.seen * self.sample) != int((self.seen - 1) * self.sample)
+
+    def acquire(self):
+        """Take one event token. Returns 0 on success, otherwise the seconds until a token is available."""
+
+        if not (self.events or self.bytes):
+            return 0
+        with self.lock:
+            now = time.time()
+            elapsed = now - self.last
+            self.last = now
+            wait = 0.0
+            if self.events:
+                self.eventTokens = min(self.events, self.eventTokens + elapsed * self.events)
+                if self.eventTokens < 1:
+                    wait = (1 - self.eventTokens) / self.events
+            if self.bytes:
+                self.byteTokens = min(self.bytes, self.byteTokens + elapsed * self.bytes)
+                if self.byteTokens < 0:
+                    wait = max(wait, -self.byteTokens / self.bytes)
+            if not wait and self.events:
+                self.eventTokens -= 1
+            return wait
+
+    def charge(self, byteCount):
+        if self.bytes:
+            with self.lock:
+                self.byteTokens -= byteCount
+
+
+class _hec_endpoint:
+
+    """Internal Class: one HEC receiver with its load balancing and health state."""
+
+    def __init__(self, server, port):
+        self.server = server
+        self.port = port
+        self.inFlight = 0
+        # moving average of post latency in seconds, used by the latency policy
+        self.latency = 0.0
+        self.ejected = False
+        self.ejectedAt = 0
+
+    def __str__(self):
+        return '%s:%s' % (self.server, self.port)
+
+
+class http_event_raw_stream:
+
+    """
+        Raw destination created with http_event_collector.stream() on a raw collector.
+
+        Every destination keeps its own byte bounded batch, posted to /raw with its index, sourcetype,
+        source and host as query parameters. All destinations share the collector's sender threads,
+        maxByteLength, maxEventsPerBatch and maxLingerMs.
+
+        Example:
+            syslog = testeventRAW.stream(index="os", sourcetype="syslog", source="/var/log/messages")
+            syslog.batchEvent("Jan  1 00:00:00 mansion sshd[1]: Accepted publickey")
+    """
+
+    def __init__(self, collector, fields):
+        self.collector = collector
+        self.fields = fields
+        self._key = tuple(sorted(fields.items()))
+
+    def batchEvent(self, event):
+        """Method to add one raw event to this destination's batch."""
+
+        collector = self.collector
+        limits = ()
+        if collector._rateLimits:
+            limits = collector._applyLimits(self.fields.get('sourcetype') or collector.sourcetype)
+            if limits is None:
+                return
+        data = str(event).encode('utf-8')
+        if not data.endswith(b"\n"):
+            data = data+b"\n"
+        collector._addToDestination(self._key, self.fields, data)
+        for limit in limits:
+            limit.charge(len(data))
+
+    def sendEvent(self, event):
+        """Method to immediately send one raw event to this destination. Returns the requests Response or None."""
+
+        return self.collector._waitForSend(self.collector._sendFormatted(str(event), self.fields))
+
+
+class http_event_stream:
+
+    """
+        Fixed metadata envelope for JSON events, created with http_event_collector.stream().
+
+        The index/sourcetype/source/host envelope is rendered to JSON once. Each event then only
+        serializes its event body and time, and the caller's dict is never copied into or modified.
+
+        Example:
+            crimes = testevent.stream(index="test", sourcetype="crime", source="witness", host="mansion")
+            crimes.batchEvent({"killer":"Professor Plum","weapon":"rope"})
+            testevent.flushBatch()
+    """
+
+    def __init__(self, collector, fields):
+        self.collector = collector
+        self.fields = fields
+        envelope = _to_bytes(collector.serializer(fields))
+        # '{"index":"test",...}' becomes the prefix '{"index":"test",...,"time":' ahead of time and event
+        self._prefix = (envelope[:-1] + b',' if fields else b'{') + b'"time":'
+
+    def _formatEvent(self, event, eventtime=""):
+        collector = self.collector
+        if collector.popNullFields and isinstance(event, dict):
+            event = {k:v for k,v in event.items() if v}
+        if not eventtime:
+            eventtime = str(round(time.time(),3))
+        # spliced as bytes, the serializer may return str or bytes
+        return b''.join((self._prefix, _to_bytes(collector.serializer(str(eventtime))), b',"event":', _to_bytes(collector.serializer(event)), b'}'))
+
+    def batchEvent(self, event, eventtime=""):
+        """Method to add one event body to the collector's batch using this envelope."""
+
+        collector = self.collector
+        limits = ()
+        if collector._rateLimits:
+            limits = collector._applyLimits(self.fields.get('sourcetype') or collector.sourcetype)
+            if limits is None:
+                return
+        start = _perf_clock()
+        payloadString = self._formatEvent(event, eventtime)
+        payloadLength = collector._addToBatch(payloadString, _perf_clock() - start)
+        for limit in limits:
+            limit.charge(payloadLength)
+
+    def sendEvent(self, event, eventtime=""):
+        """Method to immediately send one event body using this envelope. Returns the requests Response or None."""
+
+        return self.collector._waitForSend(self.collector._sendFormatted(self._formatEvent(event, eventtime)))
+
 
 class http_event_collector:
 
@@ -34,6 +564,7 @@ class http_event_collector:
         Keyword Arguments:
             token -- the Splunk HEC token value - required
             http_event_server -- the Splunk Server name or ip. Name must be network resolvable. - required
+                                 May also be a list of servers, each optionally "server:port", to spread batches across several HEC receivers.
             input_type -- json or raw HEC type - provided at init (default json)
             host -- value to use as host field for events sent to Splunk (default the local system's hostname) 
             http_event_port -- Splunk HEC network port (default 8088)
@@ -42,14 +573,45 @@ class http_event_collector:
         Attributes:
             SSL_verify -- boolean flag to force SSL certificate verification (default false)
             popNullFields -- boolean flag to pop null fields off payload prior to sending to Splunk (default false)
+            serializer -- callable turning a JSON payload dict into a str or UTF-8 bytes (default fastest of orjson, ujson, json; see json_backend)
             index -- optional index name for HEC events (default None)
             sourcetype -- optional sourcetype name for HEC events (default None)
             server_uri -- computed property for HEC uri based on HEC type, raw metadata etc.
+            session -- shared keep-alive requests session used for every post, pooled to poolSize connections
+            loadBalancePolicy -- with several servers: round_robin, least_in_flight or latency (default round_robin)
+            endpointEjectSeconds -- seconds a server that failed or returned 503 is left out before health probes may re-admit it (default 30)
+            adaptive -- boolean flag to let an AIMD controller tune batch size and sending concurrency from HEC latency and busy responses (default false)
+            adaptiveMinByteLength -- smallest batch size the controller will use (default maxByteLength / 10)
+            adaptiveMaxByteLength -- largest batch size the controller will use (default None, maxByteLength). Only raise it above
+                                     maxByteLength once max_content_length in limits.conf allows it, failed posts drop the batch unless spooled.
+            adaptiveByteStep -- bytes added to the batch size after each fast successful post (default maxByteLength / 20)
+            adaptiveTargetLatency -- seconds per post above which the controller backs off (default 1)
+            backpressurePolicy -- what to do when flushQueue is full: block, block_timeout, drop_newest, drop_oldest or buffer (default block)
+            backpressureTimeout -- seconds block_timeout waits for room before dropping the batch (default 1)
+            backpressureBufferBytes -- byte cap of the memory overflow buffer used by the buffer policy (default 50MB)
+            metricWindow -- seconds batchMetric measurements are pre-aggregated before being batched (default 10)
+            metricIndex -- optional metrics index for batchMetric events (default None, the token default)
+            useAck -- boolean flag to use HEC indexer acknowledgement and resend batches not acknowledged within ackTimeout (default false)
+            ackTimeout -- seconds to wait for an acknowledgement before a batch is resent (default 60)
+            ackPollInterval -- seconds between bulk acknowledgement checks (default 1)
+            spoolReplayInterval -- seconds between connectivity checks while the disk spool holds batches (default 30)
+            compressBatches -- boolean flag to gzip batch bodies in the sending threads and send Content-Encoding: gzip (default false)
+            compressLevel -- gzip compression level 1 (fastest) to 9 (smallest) (default 6)
+            limitCompressedSize -- boolean flag to apply maxByteLength to the estimated compressed size instead of the uncompressed size (default false)
+            maxLingerMs -- optional age in milliseconds after which a background timer flushes a partial batch (default None, batches wait for size or flushBatch)
+            processChunkSize -- payloads handed to a worker process at a time once enableProcessPool is called (default 2000)
+            senderIdleTimeout -- seconds an idle sender thread waits for a batch before exiting, None to keep them (default 60)
+            rateLimitPolicy -- what batchEvent does with an event over a setRateLimit limit: block until tokens refill, or drop (default block)
+            dedupWindow -- seconds within which identical batchEvent events are collapsed into one plus a duplicate_count summary (default 0, off)
+            dedupMaxKeys -- distinct events tracked per dedupWindow, further distinct events pass through uncollapsed (default 100000)
 
         Example Init:
             from splunk_http_event_collector import http_event_collector
             testeventJSON = http_event_collector("4D14F8D9-D788-4E6E-BF2D-D1A46441242E","localhost")
 
+            with http_event_collector("4D14F8D9-D788-4E6E-BF2D-D1A46441242E","localhost") as testevent:
+                testevent.batchEvent({"event":{"action":"success"}})
+
             For full usage example: https://github.com/georgestarcher/Splunk-Class-httpevent/blob/master/example.py
      """
 
@@ -57,25 +619,44 @@ class http_event_collector:
     # See http_input stanza in limits.conf; note in testing I had to limit to 100,000 to avoid http event collector breaking connection
     # Auto flush will occur if next event payload will exceed limit
     maxByteLength = 100000
+    # Optional cap on events per batch, auto flush will also occur once a batch holds this many events (0 for no cap)
+    maxEventsPerBatch = 0
     # Number of threads used to send events to the HEC endpoint (max concurrency).
     # If event batching is used, a single thread may send multiple events at a time in a single http request.
     threadCount = 10
     # Limit the size of the flushQueue, that buffers events for the sending threads.
     maxQueueSize = 100 * threadCount
+    # Number of keep-alive connections held by the shared HTTP session.
+    # None sizes the pool to threadCount so every sending thread can hold its own connection.
+    poolSize = None
 
     # An improved requests retry method from
     # https://www.peterbe.com/plog/best-practice-with-retries-with-requests
     # 503 added for endpoint busy
     # 408 added in case using HAproxy
 
-    def requests_retry_session(self, retries=3,backoff_factor=0.3,status_forcelist=(408,500,502,503,504),session=None):
+    def requests_retry_session(self, retries=3,backoff_factor=0.3,status_forcelist=(408,500,502,503,504),session=None,pool_size=None):
+        requests, HTTPAdapter, Retry = _requests_modules()
+        if self.SSL_verify == False:
+            requests.packages.urllib3.disable_warnings()
         session = session or requests.Session()
         retry = Retry(total=retries, read=retries, connect=retries, backoff_factor=backoff_factor, status_forcelist=status_forcelist, allowed_methods=frozenset(['HEAD', 'TRACE', 'GET', 'PUT', 'OPTIONS', 'DELETE', 'POST']))
-        adapter = HTTPAdapter(max_retries=retry)
+        pool_size = pool_size or self.poolSize or self.threadCount
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
         session.mount('http://', adapter)
         session.mount('https://', adapter)
         return session
 
+    @property
+    def session(self):
+        """Long lived keep-alive session shared by the sending threads and check_connectivity."""
+
+        if self._session is None:
+            with self._sessionLock:
+                if self._session is None:
+                    self._session = self.requests_retry_session()
+        return self._session
+
     def __init__(self,token,http_event_server,input_type='json',host="",http_event_port='8088',http_event_server_ssl=True):
 
         self.log = logging.getLogger(u'HEC')
@@ -83,24 +664,113 @@ class http_event_collector:
 
         self.token = token
         self.SSL_verify = False
-        self.http_event_server = http_event_server
         self.http_event_server_ssl = http_event_server_ssl
-        self.http_event_port = http_event_port
+        if isinstance(http_event_server, (list, tuple)):
+            self.endpoints = [self._parseEndpoint(server, http_event_port) for server in http_event_server]
+        else:
+            self.endpoints = [_hec_endpoint(http_event_server, http_event_port)]
+        self.http_event_server = self.endpoints[0].server
+        self.http_event_port = self.endpoints[0].port
+        self.loadBalancePolicy = 'round_robin'
+        self.endpointEjectSeconds = 30
+        self._endpointLock = threading.Lock()
+        self._roundRobin = 0
+        self._probeThread = None
+        # set by close() to stop the background timer threads, then replaced so they can start again on demand
+        self._stopEvent = threading.Event()
+        self._closed = False
         self.index = ""
         self.sourcetype = ""
-        self.batchEvents = []
+        self._batchEvents = _batch_buffer()
         self.currentByteLength = 0
+        self._destinations = {}
+        self.maxLingerMs = None
+        self._batchLock = threading.Lock()
+        self._batchStarted = 0
+        self._lingerThread = None
         self.input_type = input_type
         self.popNullFields = False 
-        self.flushQueue = Queue.Queue(maxsize=self.maxQueueSize)
-        for x in range(self.threadCount):
-            t = threading.Thread(target=self._batchThread)
-            t.daemon = True
-            t.start()
-        
-        if self.SSL_verify == False:
-            requests.packages.urllib3.disable_warnings()
-    
+        self.serializer = _json_dumps
+        self.compressBatches = False
+        self.compressLevel = 6
+        self.limitCompressedSize = False
+        self._compressLock = threading.Lock()
+        self._compressBytesIn = 0
+        self._compressBytesOut = 0
+        self._compressCPUTime = 0.0
+        self.adaptive = False
+        self.adaptiveMinByteLength = self.maxByteLength // 10
+        self.adaptiveMaxByteLength = None
+        self.adaptiveByteStep = self.maxByteLength // 20
+        self.adaptiveTargetLatency = 1.0
+        self._adaptiveByteLength = self.maxByteLength
+        self._adaptiveConcurrency = self.threadCount
+        self._adaptiveWindow = 0
+        self._adaptiveLatency = 0.0
+        self._adaptiveBusy = 0
+        self._statsLock = threading.Lock()
+        self._eventsQueued = 0
+        self._bytesQueued = 0
+        self._serializeTime = 0.0
+        self._batchesSent = 0
+        self._statusCounts = {}
+        self._retries = 0
+        self._batchesDropped = 0
+        self._eventsDropped = 0
+        self._latencyCounts = [0] * len(_latency_buckets_ms)
+        self._sendGate = threading.Condition()
+        self._sending = 0
+        self.backpressurePolicy = 'block'
+        self.backpressureTimeout = 1.0
+        self.backpressureBufferBytes = 50*1024*1024
+        self._overflowLock = threading.Lock()
+        self._overflow = collections.deque()
+        self._overflowBytes = 0
+        self.metricWindow = 10
+        self.metricIndex = None
+        self._metricLock = threading.Lock()
+        self._metrics = {}
+        self._metricThread = None
+        self.useAck = False
+        self.ackTimeout = 60
+        self.ackPollInterval = 1.0
+        self._ackLock = threading.Lock()
+        self._ackPending = {}
+        self._ackThread = None
+        self._ackCount = 0
+        self._ackLatencyTotal = 0.0
+        self._ackLatencyMax = 0.0
+        self._ackRedelivered = 0
+        self._spool = None
+        self._spoolOverflow = False
+        self.spoolReplayInterval = 30
+        self._spoolThread = None
+        self._statsEmitter = None
+        self._statsThread = None
+        self._rateLimits = {}
+        self.rateLimitPolicy = 'block'
+        self.dedupWindow = 0
+        self.dedupMaxKeys = 100000
+        self._dedupLock = threading.Lock()
+        self._duplicates = {}
+        self._dedupThread = None
+        self._eventsSampledOut = 0
+        self._eventsRateDropped = 0
+        self._eventsCollapsed = 0
+        self._rateLimitWait = 0.0
+        self._processPool = None
+        self._processWorkers = 0
+        self.processChunkSize = 2000
+        self._session = None
+        self._sessionLock = threading.Lock()
+        self.flushQueue = _send_queue(maxsize=self.maxQueueSize)
+        # Sender threads are started by _ensureWorkers as batches are queued, up to threadCount
+        self.senderIdleTimeout = 60
+        self._workerLock = threading.Lock()
+        self._workers = 0
+        self._idleWorkers = 0
+        self._senderStartFailed = False
+
         # Set host to specified value or default to localhostname if no value provided
         if host:
             self.host = host
@@ -111,10 +781,24 @@ class http_event_collector:
 
     @property
     def server_uri(self):
+        return self._buildUri()
+
+    @staticmethod
+    def _parseEndpoint(server, default_port):
+        # "server:port" overrides the port, a bare name or IPv6 address keeps the default
+        if server.count(':') == 1:
+            server, port = server.split(':')
+            return _hec_endpoint(server, port)
+        return _hec_endpoint(server, default_port)
+
+    def _buildUri(self, channel=None, endpoint=None, destination=None):
 
        # Build and set server_uri for http event collector
         # Defaults to SSL if flag not passed
         # Defaults to port 8088 if port not passed
+        # Raw requests use a fresh channel unless a stable one is passed for indexer acknowledgement
+        # endpoint picks one of several HEC receivers, otherwise http_event_server is used
+        # destination holds per batch raw metadata from a raw stream() and replaces sourcetype/index
 
         if self.http_event_server_ssl:
             protocol = 'https'
@@ -122,16 +806,24 @@ class http_event_collector:
             protocol = 'http'
 
         if self.input_type == 'raw':
-            input_url = '/raw?channel='+str(uuid.uuid1())
-            if self.sourcetype: input_url = input_url+'&sourcetype='+self.sourcetype
-            if self.index: input_url = input_url+'&index='+self.index
+            input_url = '/raw?channel='+(channel or str(uuid.uuid1()))
+            if destination:
+                for field in ('index','sourcetype','source','host'):
+                    if destination.get(field): input_url = input_url+'&'+field+'='+quote(str(destination[field]), safe='/:')
+            else:
+                if self.sourcetype: input_url = input_url+'&sourcetype='+self.sourcetype
+                if self.index: input_url = input_url+'&index='+self.index
         else:
             input_url = '/event'
             if self.sourcetype or self.index: input_url = input_url+'?'
             if self.sourcetype: input_url = input_url+'sourcetype='+self.sourcetype+"&"
             if self.index: input_url = input_url+'index='+self.index+"&"
 
-        server_uri = '%s://%s:%s/services/collector%s' % (protocol, self.http_event_server, self.http_event_port, input_url)
+        if endpoint is not None:
+            server, port = endpoint.server, endpoint.port
+        else:
+            server, port = self.http_event_server, self.http_event_port
+        server_uri = '%s://%s:%s/services/collector%s' % (protocol, server, port, input_url)
         return (server_uri)
 
     def check_connectivity(self):
@@ -145,8 +837,24 @@ class http_event_collector:
             method will return true even if HEC token is wrong because system is reachable. 
             method will log warning on reachable errors to show bad token
             method will warn on splunk hec server health codes
+            with several servers every one is checked, unreachable ones are ejected and the method returns true if any is reachable
         """
 
+        if len(self.endpoints) == 1:
+            return self._probe()
+
+        hec_reachable = False
+        for endpoint in self.endpoints:
+            if self._probe(endpoint):
+                self._readmitEndpoint(endpoint)
+                hec_reachable = True
+            else:
+                self._ejectEndpoint(endpoint)
+        return (hec_reachable)
+
+    def _probe(self, endpoint=None):
+        """Internal Function: Connectivity check against one HEC receiver, see check_connectivity."""
+
         self.log.info("Checking HEC Server URI reachability.")
         headers = {'Authorization':'Splunk '+self.token, 'X-Splunk-Request-Channel':str(uuid.uuid1())}
         payload = dict()
@@ -155,7 +863,7 @@ class http_event_collector:
         acceptable_status_codes = [400,401,403]
         heath_warning_status_codes = [500,503]
         try:
-            response = self.requests_retry_session().post(self.server_uri, data=payload, headers=headers, verify=self.SSL_verify)
+            response = self.session.post(self._buildUri(endpoint=endpoint), data=payload, headers=headers, verify=self.SSL_verify)
             if response:
                 self.log.info("Splunk Server URI is reachable.")
                 hec_reachable = True
@@ -177,99 +885,1287 @@ class http_event_collector:
         return (hec_reachable)
 
 
-    def sendEvent(self,payload,eventtime=""):
+    def _formatEvent(self,payload,eventtime="",lineBreak=False):
         """
-        Method to immediately send an event to the http event collector
-        
-        When the internal queue is exausted, this function _blocks_ until a slot is available.
+        Internal Function: Render one payload as the string sent to HEC.
+
+        JSON payloads get host and time defaults, optional null field popping and are serialized.
+        Raw payloads are converted to a string, with a trailing newline added when lineBreak is set.
         """
 
         if self.input_type == 'json':
+            # Fill in local hostname if not manually populated
+            if 'host' not in payload:
+                payload.update({"host":self.host})
+
             # If eventtime in epoch not passed as optional argument and not in payload, use current system time in epoch
             if not eventtime and 'time' not in payload:
                 eventtime = str(round(time.time(),3))
             if eventtime and 'time' not in payload:
                 payload.update({'time':eventtime})
-
-            # Fill in local hostname if not manually populated
-            if 'host' not in payload:
-                payload.update({"host":self.host})
-
-        # send event to http event collector
-        event = []
-        if self.input_type == 'json':
             if self.popNullFields:
                 payloadEvent = payload.get('event')
                 payloadEvent = {k:payloadEvent.get(k) for k,v in payloadEvent.items() if v}
                 payload.update({"event":payloadEvent})
-            event.append(json.dumps(payload, default=str))
-        else:
-            event.append(str(payload))
+            return self.serializer(payload)
+
+        payloadString = str(payload)
+        if lineBreak and not payloadString.endswith("\n"):
+            payloadString = payloadString+"\n"
+        return payloadString
+
+    def sendEvent(self,payload,eventtime=""):
+        """
+        Method to immediately send an event to the http event collector
+        
+        Waits only for this event's own request, not for batches queued by other producers.
+        Returns the requests Response, or None if the send failed or was dropped.
+        When the internal queue is exausted, this function follows backpressurePolicy, by default it _blocks_ until a slot is available.
+        """
+
+        return self._waitForSend(self.sendEventAsync(payload, eventtime))
+
+    def sendEventAsync(self,payload,eventtime=""):
+        """
+        Method to send an event immediately without waiting for it.
+
+        Returns a concurrent.futures.Future resolved with the requests Response for this event, or with the
+        exception if the post failed or the event was dropped by backpressurePolicy.
+        Single events are sent ahead of queued batches.
+        """
+
+        # send event to http event collector
+        return self._sendFormatted(self._formatEvent(payload, eventtime))
 
-        self.flushQueue.put(event)
+    def _sendFormatted(self, payloadString, destination=None):
+        """Internal Function: Queue one serialized event ahead of batches and return its Future."""
+
+        event = _single_event(_to_bytes(payloadString), destination)
+
+        with self._batchLock:
+            self._eventsQueued += 1
+            self._bytesQueued += len(event)
+        self._enqueue(event)
         self.log.debug("Single Submit: Sticking the event on the queue.")
         self.log.debug("event:%s",event)
-        self._waitUntilDone()
+        return event.future
+
+    def sendBatchAsync(self, body, eventCount, destination=None):
+        """
+        Method to queue a batch body that is already built, e.g. complete lines read from a file for a raw collector.
+
+        Keyword Arguments:
+            body -- bytes-like request body, kept within maxByteLength by the caller. A _batch_buffer, e.g. one being
+                    resent, is queued as it is without a copy and must not be changed until the Future resolves.
+            eventCount -- number of events in body, used for stats
+            destination -- optional dict of index, sourcetype, source and host query parameters for a raw collector
+
+        Returns a concurrent.futures.Future resolved with the requests Response once the batch is posted, or with
+        the exception if the post failed or the batch was dropped by backpressurePolicy.
+        """
+
+        if isinstance(body, _batch_buffer):
+            batch = body
+            batch.destination = destination
+            batch.eventCount = eventCount
+        else:
+            batch = _batch_buffer(body, destination, eventCount)
+        batch.future = Future()
+        with self._batchLock:
+            self._eventsQueued += eventCount
+            self._bytesQueued += len(batch)
+        self._enqueue(batch)
+        return batch.future
+
+    def _waitForSend(self, future):
+        """Internal Function: Block on one sendEvent Future, failures are already logged by the sending thread."""
+
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def stream(self, **fields):
+        """
+        Method to register a fixed envelope such as index, sourcetype, source and host.
+
+        For input_type json returns an http_event_stream whose batchEvent/sendEvent take only the event body,
+        host defaults to the collector host.
+        For input_type raw returns an http_event_raw_stream with its own batch per distinct set of fields,
+        so one collector can feed many raw destinations.
+        """
+
+        if self.input_type == 'raw':
+            return http_event_raw_stream(self, fields)
+        fields.setdefault('host', self.host)
+        return http_event_stream(self, fields)
 
     def batchEvent(self,payload,eventtime=""):
         """
         Recommended Method to place the event on the batch queue. Queue will auto flush as needed.
 
-        When the internal queue is exausted, this function _blocks_ until a slot is available.
+        Safe to call from several threads sharing one collector instance.
+        When the internal queue is exausted, this function follows backpressurePolicy, by default it _blocks_ until a slot is available.
+        Duplicate collapsing, sampling and rate limits are applied first, so events they drop are never serialized.
         """
 
+        limits = ()
+        if self._rateLimits or self.dedupWindow:
+            limits = self._admit(payload)
+            if limits is None:
+                return
+        start = _perf_clock()
+        payloadString = self._formatEvent(payload, eventtime, lineBreak=True)
+        payloadLength = self._addToBatch(payloadString, _perf_clock() - start)
+        for limit in limits:
+            limit.charge(payloadLength)
+
+    def setRateLimit(self, eventsPerSecond=None, bytesPerSecond=None, sourcetype=None):
+        """
+        Method to cap how fast events are batched, for the whole collector or for one sourcetype.
+
+        Keyword Arguments:
+            eventsPerSecond -- events per second, None for no event rate cap
+            bytesPerSecond -- serialized bytes per second, None for no byte rate cap
+            sourcetype -- apply to events of this sourcetype only (payload sourcetype, stream sourcetype or the collector sourcetype); None for every event
+
+        Events over the limit block or drop according to rateLimitPolicy, before they are serialized.
+        Bursts of up to one second of either rate pass straight through.
+        """
+
+        limit = self._rateLimits.get(sourcetype) or _rate_limit()
+        limit.events = eventsPerSecond
+        limit.bytes = bytesPerSecond
+        limit.eventTokens = eventsPerSecond or 0.0
+        limit.byteTokens = bytesPerSecond or 0.0
+        self._rateLimits[sourcetype] = limit
+
+    def setSampling(self, rate, sourcetype=None):
+        """
+        Method to keep only a fraction of the events, for the whole collector or for one sourcetype.
+
+        rate is the fraction kept, e.g. 0.1 sends every tenth event. Sampling is deterministic, an even spread
+        of exactly that fraction, and is applied before rate limits and serialization.
+        """
+
+        limit = self._rateLimits.get(sourcetype) or _rate_limit()
+        limit.sample = rate
+        self._rateLimits[sourcetype] = limit
+
+    def _admit(self, payload):
+        """Internal Function: Duplicate collapsing, sampling and rate limits for one payload. Returns the limits to charge bytes to, or None to drop it."""
+
         if self.input_type == 'json':
-            # Fill in local hostname if not manually populated
-            if 'host' not in payload:
-                payload.update({"host":self.host})
+            sourcetype = payload.get('sourcetype') or self.sourcetype
+        else:
+            sourcetype = self.sourcetype
+        if self.dedupWindow and self._collapse(payload):
+            return None
+        if not self._rateLimits:
+            return ()
+        return self._applyLimits(sourcetype)
+
+    def _applyLimits(self, sourcetype):
+        """Internal Function: Sample and rate limit one event of sourcetype. Returns the limits to charge bytes to, or None to drop it."""
+
+        limits = self._rateLimits
+        collectorLimit = limits.get(None)
+        sourcetypeLimit = limits.get(sourcetype) if sourcetype else None
+        if collectorLimit is None:
+            if sourcetypeLimit is None:
+                return ()
+            limits = (sourcetypeLimit,)
+        elif sourcetypeLimit is None:
+            limits = (collectorLimit,)
+        else:
+            limits = (collectorLimit, sourcetypeLimit)
+        for limit in limits:
+            if not limit.sampled():
+                with self._statsLock:
+                    self._eventsSampledOut += 1
+                return None
+        for limit in limits:
+            wait = limit.acquire()
+            while wait:
+                if self.rateLimitPolicy == 'drop':
+                    with self._statsLock:
+                        self._eventsRateDropped += 1
+                    return None
+                with self._statsLock:
+                    self._rateLimitWait += wait
+                time.sleep(wait)
+                wait = limit.acquire()
+        return limits
+
+    def _collapse(self, payload):
+        """
+        Internal Function: Returns True if an identical event was already batched in the current dedupWindow.
 
-            # If eventtime in epoch not passed as optional argument and not in payload, use current system time in epoch
-            if not eventtime and 'time' not in payload:
-                eventtime = str(round(time.time(),3))
-            if eventtime and 'time' not in payload:
-                payload.update({'time':eventtime})
-            if self.popNullFields:
-                payloadEvent = payload.get('event')
-                payloadEvent = {k:payloadEvent.get(k) for k,v in payloadEvent.items() if v}
-                payload.update({"event":payloadEvent})
-            payloadString = json.dumps(payload, default=str)
+        JSON events are identical when event, sourcetype, source, index and host match, raw events when the text matches.
+        The table is keyed on a 20 byte digest of the repr (or text) and holds at most dedupMaxKeys events, so its size
+        does not depend on event size. A copy of the payload is taken on its first duplicate for the summary.
+        """
+
+        if self.input_type == 'json':
+            text = repr((payload.get('event'), payload.get('sourcetype'), payload.get('source'), payload.get('index'), payload.get('host')))
+        else:
+            text = str(payload)
+        key = hashlib.sha1(text.encode('utf-8')).digest()
+        with self._dedupLock:
+            if self._dedupThread is None:
+                self._dedupThread = threading.Thread(target=self._dedupWindowThread, args=(self._stopEvent,))
+                self._dedupThread.daemon = True
+                self._dedupThread.start()
+            entry = self._duplicates.get(key)
+            if entry is None:
+                if len(self._duplicates) < self.dedupMaxKeys:
+                    self._duplicates[key] = [None, 0]
+                return False
+            if entry[0] is None:
+                entry[0] = dict(payload) if self.input_type == 'json' else text
+            entry[1] += 1
+            self._eventsCollapsed += 1
+            return True
+
+    def _flushDuplicates(self):
+        """Internal Function: Close the dedup window, batching one summary event with duplicate_count for every collapsed event."""
+
+        with self._dedupLock:
+            duplicates = self._duplicates
+            self._duplicates = {}
+        for summary, count in duplicates.values():
+            if not count:
+                continue
+            if self.input_type == 'json':
+                fields = dict(summary.get('fields') or {})
+                fields['duplicate_count'] = count
+                summary['fields'] = fields
+                self._addToBatch(self._formatEvent(summary, lineBreak=True))
+            else:
+                self._addToBatch(summary.rstrip("\n") + " duplicate_count=%d\n" % count)
+
+    def _dedupWindowThread(self, stop):
+        """Internal Function: Thread to close the duplicate collapsing window every dedupWindow seconds until close()."""
+
+        while not stop.wait(self.dedupWindow or 1):
+            self._flushDuplicates()
+
+    def batchMetric(self, name, value, dims=None, kind='gauge'):
+        """
+        Method to add one measurement to the HEC metrics batch.
+
+        Keyword Arguments:
+            name -- metric name, e.g. cpu.percent
+            value -- numeric value
+            dims -- optional dict of dimension fields, e.g. {"region":"east"}
+            kind -- gauge keeps the last value in the window, counter sums the values (default gauge)
+
+        Measurements are pre-aggregated for metricWindow seconds. Every measurement sharing the same
+        dims becomes a single multi-metric event, which then goes through the normal batching.
+        Only valid for input_type json.
+        """
+
+        self.batchMetrics({name:value}, dims, kind)
+
+    def batchMetrics(self, values, dims=None, kind='gauge'):
+        """Method to add several measurements sharing the same dims, see batchMetric."""
+
+        if self.input_type != 'json':
+            raise ValueError("metrics require input_type json")
+        key = tuple(sorted(dims.items())) if dims else ()
+        with self._metricLock:
+            if self._metricThread is None:
+                self._metricThread = threading.Thread(target=self._metricWindowThread, args=(self._stopEvent,))
+                self._metricThread.daemon = True
+                self._metricThread.start()
+            group = self._metrics.setdefault(key, {})
+            if kind == 'counter':
+                for name, value in values.items():
+                    group[name] = group.get(name, 0) + value
+            else:
+                group.update(values)
+
+    def _flushMetrics(self):
+        """Internal Function: Render the aggregated metrics as multi-metric events and add them to the batch."""
+
+        with self._metricLock:
+            metrics = self._metrics
+            self._metrics = {}
+        if not metrics:
+            return
+        eventtime = round(time.time(),3)
+        for key, group in metrics.items():
+            fields = dict(key)
+            for name, value in group.items():
+                fields['metric_name:'+name] = value
+            payload = {'time':eventtime, 'event':'metric', 'host':self.host, 'fields':fields}
+            if self.metricIndex:
+                payload['index'] = self.metricIndex
+            start = _perf_clock()
+            payloadString = self.serializer(payload)
+            self._addToBatch(payloadString, _perf_clock() - start)
+
+    def _metricWindowThread(self, stop):
+        """Internal Function: Thread to close the metric aggregation window every metricWindow seconds until close()."""
+
+        while not stop.wait(self.metricWindow):
+            self._flushMetrics()
+
+    def batchEvents(self, payloads):
+        """
+        Method to batch every payload from an iterable or generator in one tight loop.
+
+        Payloads are handled the same way as batchEvent, but attribute lookups, timestamps and limit checks are
+        hoisted out of the per-event path. Full batches are built locally and queued as they fill, so only one
+        batch is held in memory however long the input is. The final partial batch is merged into the shared batch.
+
+        With enableProcessPool the payloads are serialized in worker processes instead, see _batchEventsInPool.
 
+        Returns the number of events batched, not counting events dropped by sampling, rate limits or duplicate collapsing.
+        The process pool path does not apply those.
+        """
+
+        if self._processPool is not None:
+            return self._batchEventsInPool(payloads)
+
+        dumps = self.serializer
+        isJson = self.input_type == 'json'
+        popNullFields = self.popNullFields
+        host = self.host
+        maxEvents = self.maxEventsPerBatch
+        maxByteLength = self._batchByteLimit()
+        clock = time.time
+        lastTime = None
+        timeString = ""
+        limited = bool(self._rateLimits or self.dedupWindow)
+        limits = ()
+
+        batch = _batch_buffer()
+        count = 0
+        queuedBytes = 0
+        serializeTime = 0.0
+        for payload in payloads:
+            if limited:
+                limits = self._admit(payload)
+                if limits is None:
+                    continue
+            start = _perf_clock()
+            if isJson:
+                if 'host' not in payload:
+                    payload['host'] = host
+                if 'time' not in payload:
+                    # rendering the timestamp is the costly part, only redo it once the millisecond changes
+                    now = round(clock(),3)
+                    if now != lastTime:
+                        lastTime = now
+                        timeString = str(now)
+                    payload['time'] = timeString
+                if popNullFields:
+                    payloadEvent = payload.get('event')
+                    payload['event'] = {k:v for k,v in payloadEvent.items() if v}
+                data = dumps(payload)
+                if not isinstance(data, bytes):
+                    data = data.encode('utf-8')
+            else:
+                data = str(payload).encode('utf-8')
+                if not data.endswith(b"\n"):
+                    data = data+b"\n"
+            serializeTime += _perf_clock() - start
+
+            if batch and (len(batch)+len(data) > maxByteLength or (maxEvents and batch.eventCount >= maxEvents)):
+                self.log.debug("Bulk Flush: Sticking the batch on the queue.")
+                self._enqueue(batch)
+                queuedBytes += len(batch)
+                batch = _batch_buffer()
+                maxByteLength = self._batchByteLimit()
+            batch.add(data)
+            count += 1
+            for limit in limits:
+                limit.charge(len(data))
+
+        with self._batchLock:
+            self._eventsQueued += count
+            self._bytesQueued += queuedBytes + len(batch)
+            self._serializeTime += serializeTime
+        if batch:
+            self._mergeTail(batch)
+        return count
+
+    def enableProcessPool(self, workers=None, mp_context=None):
+        """
+        Method to serialize batchEvents and sendStream payloads in a pool of worker processes.
+
+        Keyword Arguments:
+            workers -- number of worker processes (default os.cpu_count())
+            mp_context -- optional multiprocessing context, e.g. multiprocessing.get_context('spawn') (Python 3.7+)
+
+        Payloads are handed to the workers processChunkSize at a time. Each worker applies the host, time and
+        popNullFields handling, serializes and returns complete encoded batches which go straight to the
+        sending threads, so producers with heavy serialization work use more than one core.
+        Payloads must be picklable and serializer must be a module level function. The caller's dicts are not updated.
+        """
+
+        if ProcessPoolExecutor is None:
+            raise ImportError("enableProcessPool needs concurrent.futures, on Python 2 pip install futures")
+        import multiprocessing
+        self._processWorkers = workers or multiprocessing.cpu_count()
+        if mp_context is None:
+            self._processPool = ProcessPoolExecutor(self._processWorkers)
         else:
-            payloadString = str(payload)
-            if not payloadString.endswith("\n"):
-                payloadString=payloadString+"\n"
+            self._processPool = ProcessPoolExecutor(self._processWorkers, mp_context=mp_context)
 
-        payloadLength = len(payloadString)
+    def _batchEventsInPool(self, payloads):
+        """
+        Internal Function: batchEvents through the process pool.
 
-        if ((self.currentByteLength+payloadLength) > self.maxByteLength or (self.maxByteLength - self.currentByteLength) < payloadLength):
-            self.log.debug("Auto Flush: Sticking the batch on the queue.")
-            self.flushQueue.put(self.batchEvents)
-            self.batchEvents = []
-            self.currentByteLength = 0
+        At most two chunks per worker are outstanding, so memory stays bounded for long generators.
+        Bodies are queued in input order. The final partial batch of every chunk is queued as it is rather than merged.
+        """
 
-        self.batchEvents.append(payloadString)
-        self.currentByteLength += payloadLength
+        options = (self.input_type == 'json', self.popNullFields, self.host, self.serializer, self._batchByteLimit(), self.maxEventsPerBatch)
+        window = 2 * self._processWorkers
+        chunkSize = self.processChunkSize
+        pending = collections.deque()
+        count = 0
+        chunk = []
+        for payload in payloads:
+            chunk.append(payload)
+            if len(chunk) >= chunkSize:
+                pending.append(self._processPool.submit(_build_batch_bodies, chunk, *options))
+                chunk = []
+                if len(pending) >= window:
+                    count += self._queueBodies(*pending.popleft().result())
+        if chunk:
+            pending.append(self._processPool.submit(_build_batch_bodies, chunk, *options))
+        while pending:
+            count += self._queueBodies(*pending.popleft().result())
+        return count
+
+    def _queueBodies(self, batches, serializeTime):
+        """Internal Function: Queue batches built by a worker process, returns the number of events they hold."""
+
+        count = 0
+        byteCount = 0
+        for batch in batches:
+            count += batch.eventCount
+            byteCount += len(batch)
+        with self._batchLock:
+            self._eventsQueued += count
+            self._bytesQueued += byteCount
+            self._serializeTime += serializeTime
+        for batch in batches:
+            self.log.debug("Process Pool Flush: Sticking the batch on the queue.")
+            self._enqueue(batch)
+        return count
+
+    def sendStream(self, payloads):
+        """
+        Method to send every payload from an iterable or generator and wait until all of it is delivered.
+
+        Same as batchEvents followed by flushBatch. Returns the number of events sent.
+        """
+
+        count = self.batchEvents(payloads)
+        self.flushBatch()
+        return count
+
+    def _addToBatch(self, payloadString, serializeTime=0.0):
+        """Internal Function: Append a serialized event to the current batch, queueing the batch when full. Returns its length in bytes."""
+
+        data = _to_bytes(payloadString)
+        payloadLength = len(data)
+        maxByteLength = self._batchByteLimit()
+
+        if self.maxLingerMs and self._lingerThread is None:
+            self._startLingerThread()
+
+        # Only the size check and list swap happen under the lock. Serialization in the callers and the
+        # possibly blocking flushQueue.put below run outside it so producers do not stall each other.
+        fullBatch = None
+        with self._batchLock:
+            if self._batchEvents and (self.currentByteLength+payloadLength) > maxByteLength:
+                self.log.debug("Auto Flush: Sticking the batch on the queue.")
+                fullBatch = self._takeBatch()
+            elif self.maxEventsPerBatch and self._batchEvents.eventCount >= self.maxEventsPerBatch:
+                self.log.debug("Auto Flush: Event count reached. Sticking the batch on the queue.")
+                fullBatch = self._takeBatch()
+
+            if not self._batchEvents:
+                self._batchStarted = time.time()
+            self._batchEvents.add(data)
+            self.currentByteLength += payloadLength
+            # counted here because the lock is already held, keeping instrumentation off the hot path
+            self._eventsQueued += 1
+            self._bytesQueued += payloadLength
+            self._serializeTime += serializeTime
+
+        if fullBatch:
+            self._enqueue(fullBatch)
+        return payloadLength
+
+    def _mergeTail(self, tail):
+        """Internal Function: Merge a partial batch built by batchEvents into the shared batch, already counted in stats."""
+
+        maxByteLength = self._batchByteLimit()
+        fullBatch = None
+        with self._batchLock:
+            batch = self._batchEvents
+            if batch and (len(batch)+len(tail) > maxByteLength or (self.maxEventsPerBatch and batch.eventCount+tail.eventCount > self.maxEventsPerBatch)):
+                self.log.debug("Auto Flush: Sticking the batch on the queue.")
+                fullBatch = self._takeBatch()
+            if self._batchEvents:
+                self._batchEvents.extend(tail)
+                self._batchEvents.eventCount += tail.eventCount
+            else:
+                self._batchStarted = time.time()
+                self._batchEvents = tail
+            self.currentByteLength = len(self._batchEvents)
+
+        if fullBatch:
+            self._enqueue(fullBatch)
+
+    def _addToDestination(self, key, destination, data):
+        """Internal Function: Append an encoded raw event to its destination batch, queueing that batch when full."""
+
+        payloadLength = len(data)
+        maxByteLength = self._batchByteLimit()
+
+        if self.maxLingerMs and self._lingerThread is None:
+            self._startLingerThread()
+
+        fullBatch = None
+        with self._batchLock:
+            batch = self._destinations.get(key)
+            if batch is None:
+                batch = self._destinations[key] = _batch_buffer(destination=destination)
+            elif batch and (len(batch) + payloadLength > maxByteLength or (self.maxEventsPerBatch and batch.eventCount >= self.maxEventsPerBatch)):
+                self.log.debug("Auto Flush: Sticking the destination batch on the queue.")
+                fullBatch = batch
+                batch = self._destinations[key] = _batch_buffer(destination=destination)
+
+            if not batch:
+                batch.started = time.time()
+            batch.add(data)
+            self._eventsQueued += 1
+            self._bytesQueued += payloadLength
+
+        if fullBatch:
+            self._enqueue(fullBatch)
+
+    def _enqueue(self, batch):
+        """
+        Internal Function: Put a batch on the flushQueue, applying backpressurePolicy when the queue is full.
+
+        Overflow spooling from enableSpool(overflow=True) takes precedence over the policy.
+        """
+
+        policy = self.backpressurePolicy
+        if policy == 'block' and not self._spoolOverflow:
+            self.flushQueue.put(batch)
+            self._ensureWorkers()
+            return
+        try:
+            if policy == 'block_timeout' and not self._spoolOverflow:
+                self.flushQueue.put(batch, timeout=self.backpressureTimeout)
+            else:
+                self.flushQueue.put_nowait(batch)
+            self._ensureWorkers()
+            return
+        except Queue.Full:
+            pass
+
+        if self._spoolOverflow:
+            self.log.debug("Queue Full: Spooling the batch to disk.")
+            self._spoolBatch(batch)
+        elif policy == 'drop_oldest':
+            self._replaceOldest(batch)
+        elif policy == 'buffer':
+            self._bufferOverflow(batch)
+        else:
+            self.log.debug("Queue Full: Dropping the newest batch.")
+            self._recordDropped(batch)
+
+    def _ensureWorkers(self):
+        """
+        Internal Function: Start another sender thread while queued batches outnumber idle senders, up to threadCount.
+
+        Called after every put, so a sender that just timed out on an empty queue can never strand a batch.
+        """
+
+        if self._closed:
+            self._reopen()
+        with self._workerLock:
+            if self._workers >= self.threadCount or self.flushQueue.qsize() <= self._idleWorkers:
+                return
+            t = threading.Thread(target=self._batchThread)
+            t.daemon = True
+            try:
+                t.start()
+            except RuntimeError:
+                # no new threads at interpreter shutdown, _waitUntilDone and _atexitFlush send inline instead
+                self._senderStartFailed = True
+                return
+            self._senderStartFailed = False
+            self._workers += 1
+            self._idleWorkers += 1
+
+    def _reopen(self):
+        """Internal Function: Start again the background threads close() stopped that are not started lazily on their own."""
+
+        self._closed = False
+        if self._spool is not None:
+            self._startSpoolReplay()
+        if self._statsEmitter is not None:
+            self._startStatsEmitter()
+        with self._ackLock:
+            if self._ackPending and self._ackThread is None:
+                self._ackThread = threading.Thread(target=self._ackPollThread, args=(self._stopEvent,))
+                self._ackThread.daemon = True
+                self._ackThread.start()
+
+    def _replaceOldest(self, batch):
+        """Internal Function: Drop queued batches, oldest first, until the new batch fits. Single sendEvent items are never dropped for it."""
+
+        while True:
+            oldest = self.flushQueue.takeOldestBatch()
+            if oldest is not None:
+                self.flushQueue.task_done()
+                self.log.debug("Queue Full: Dropping the oldest batch.")
+                self._recordDropped(oldest)
+            elif self.flushQueue.full():
+                self.log.debug("Queue Full: Only single events queued, dropping the newest batch.")
+                self._recordDropped(batch)
+                return
+            try:
+                self.flushQueue.put_nowait(batch)
+                self._ensureWorkers()
+                return
+            except Queue.Full:
+                continue
+
+    def _bufferOverflow(self, batch):
+        """Internal Function: Hold a batch in the memory overflow buffer, dropping it if backpressureBufferBytes would be exceeded."""
+
+        batchBytes = len(batch)
+        with self._overflowLock:
+            if self._overflowBytes + batchBytes <= self.backpressureBufferBytes:
+                self._overflow.append((batch, batchBytes))
+                self._overflowBytes += batchBytes
+                return
+        self.log.debug("Overflow Buffer Full: Dropping the newest batch.")
+        self._recordDropped(batch)
+
+    def _drainOverflow(self):
+        """Internal Function: Move buffered overflow batches onto the flushQueue while it has room."""
+
+        with self._overflowLock:
+            while self._overflow:
+                try:
+                    self.flushQueue.put_nowait(self._overflow[0][0])
+                except Queue.Full:
+                    return
+                batch, batchBytes = self._overflow.popleft()
+                self._overflowBytes -= batchBytes
+
+    def _takeBatch(self):
+        """Internal Function: Detach and return the current batch, starting a new one. Caller holds _batchLock."""
+
+        batch = self._batchEvents
+        self._batchEvents = _batch_buffer()
+        self.currentByteLength = 0
+        return batch
+
+    def _startLingerThread(self):
+        """Internal Function: Start the linger timer thread once maxLingerMs is in use."""
+
+        with self._batchLock:
+            if self._lingerThread is None:
+                self._lingerThread = threading.Thread(target=self._lingerFlushThread, args=(self._stopEvent,))
+                self._lingerThread.daemon = True
+                self._lingerThread.start()
+
+    def _lingerFlushThread(self, stop):
+        """Internal Function: Thread to flush a partial batch once it is older than maxLingerMs, until close()."""
+
+        while not stop.is_set():
+            linger = (self.maxLingerMs or 1000) / 1000.0
+            remaining = linger
+            expired = []
+            with self._batchLock:
+                if self.maxLingerMs:
+                    now = time.time()
+                    if self._batchEvents:
+                        left = self._batchStarted + linger - now
+                        if left <= 0:
+                            expired.append(self._takeBatch())
+                        else:
+                            remaining = min(remaining, left)
+                    for key, batch in list(self._destinations.items()):
+                        left = batch.started + linger - now
+                        if left <= 0:
+                            # idle destinations are dropped from the table, not kept as empty batches
+                            del self._destinations[key]
+                            if batch:
+                                expired.append(batch)
+                        else:
+                            remaining = min(remaining, left)
+            for batch in expired:
+                self.log.debug("Linger Flush: Sticking the batch on the queue.")
+                self._enqueue(batch)
+            stop.wait(remaining)
 
     def _batchThread(self):
-        """Internal Function: Threads to send batches of events."""
+        """Internal Function: Threads to send batches of events, exiting after senderIdleTimeout seconds without work."""
         
+        # Stable channel for this thread so acknowledgements can be looked up later
+        ackChannel = str(uuid.uuid1())
+
         while True:
+            try:
+                batch = self.flushQueue.get(timeout=self.senderIdleTimeout)
+            except Queue.Empty:
+                with self._workerLock:
+                    # re-checked under the lock _ensureWorkers takes after each put
+                    if self.flushQueue.qsize() == 0:
+                        self._workers -= 1
+                        self._idleWorkers -= 1
+                        return
+                continue
+            with self._workerLock:
+                self._idleWorkers -= 1
+            if batch is None:
+                # stop marker from close()
+                with self._workerLock:
+                    self._workers -= 1
+                self.flushQueue.task_done()
+                return
             self.log.debug("Events received on thread. Sending to Splunk.")
-            payload = " ".join(self.flushQueue.get())
+            self._sendBatch(batch, ackChannel)
+
+            # refill from the overflow buffer before task_done so flushBatch keeps waiting for buffered batches
+            if self._overflow:
+                self._drainOverflow()
+            with self._workerLock:
+                self._idleWorkers += 1
+            self.flushQueue.task_done()
+
+    def _sendBatch(self, batch, ackChannel):
+        """Internal Function: Post one batch and record the outcome, spooling or dropping it on failure."""
+
+        # the buffer is already the encoded request body
+        payload = batch
+        channel = ackChannel if self.useAck else str(uuid.uuid1())
+        headers = {'Authorization':'Splunk '+self.token, 'X-Splunk-Request-Channel':channel}
+        if self.compressBatches:
+            payload = self._compress(payload)
+            headers['Content-Encoding'] = 'gzip'
+        adaptive = self.adaptive
+        if adaptive:
+            self._acquireSendSlot()
+        start = time.time()
+        # try to post payload twice then give up and move on
+        try:
+            response, endpoint = self._postBatch(payload, headers, channel, getattr(batch, 'destination', None))
+            self.log.debug("batch_thread: http_status_code=%s http_message=%s",response.status_code,response.text)
+            if self.useAck and response.status_code == 200:
+                self._trackAck(endpoint, channel, response, batch)
+            if batch.future is not None and not batch.future.done():
+                batch.future.set_result(response)
+            retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+            self._recordPost(response.status_code, time.time() - start, len(retries))
+            if adaptive:
+                self._adaptiveUpdate(time.time() - start, response.status_code in (429,503))
+        except Exception as e:
+            self.log.exception(e)
+            if adaptive:
+                self._adaptiveUpdate(time.time() - start, True)
+            if self._spool is not None:
+                self._spoolBatch(batch)
+            else:
+                self._recordDropped(batch, e)
+            if batch.future is not None and not batch.future.done():
+                batch.future.set_exception(e)
+            self._recordPost(None, time.time() - start, self.session.get_adapter(self.server_uri).max_retries.total)
+        # the Response keeps the request body, i.e. this batch, so unlinking the resolved future lets the batch be
+        # freed as soon as the caller is done with it instead of at the next cycle collection
+        batch.future = None
+        if adaptive:
+            self._releaseSendSlot()
+            
+    def _postBatch(self, payload, headers, channel, destination=None):
+        """
+        Internal Function: Post a batch to a HEC receiver picked by loadBalancePolicy.
+
+        A receiver that raises a connection error or answers 503 after retries is ejected and the batch is
+        tried on the next one. Returns (response, endpoint), endpoint is None with a single server.
+        """
+
+        tried = []
+        while True:
+            endpoint = self._pickEndpoint(tried)
+            start = time.time()
+            try:
+                response = self.session.post(self._buildUri(channel, endpoint, destination), data=payload, headers=headers, verify=self.SSL_verify)
+            except Exception:
+                self._releaseEndpoint(endpoint, None)
+                if endpoint is None or len(tried) + 1 >= len(self.endpoints):
+                    raise
+                self.log.warn("Failover: endpoint=%s failed, trying another HEC receiver.",endpoint)
+                tried.append(endpoint)
+                continue
+            if response.status_code == 503 and endpoint is not None and len(tried) + 1 < len(self.endpoints):
+                self._releaseEndpoint(endpoint, None)
+                self.log.warn("Failover: endpoint=%s is busy, trying another HEC receiver.",endpoint)
+                tried.append(endpoint)
+                continue
+            self._releaseEndpoint(endpoint, None if response.status_code == 503 else time.time() - start)
+            return (response, endpoint)
+
+    def _pickEndpoint(self, exclude=()):
+        """Internal Function: Choose the receiver for the next post and count it as in flight."""
+
+        if len(self.endpoints) == 1:
+            return None
+        with self._endpointLock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if not e.ejected] or candidates
+            if self.loadBalancePolicy == 'least_in_flight':
+                endpoint = min(healthy, key=lambda e: (e.inFlight, e.latency))
+            elif self.loadBalancePolicy == 'latency':
+                # weight each receiver by the inverse of its average latency, unmeasured ones count as fast
+                weights = [1.0 / max(e.latency, 0.001) for e in healthy]
+                pick = random.random() * sum(weights)
+                for endpoint, weight in zip(healthy, weights):
+                    pick -= weight
+                    if pick <= 0:
+                        break
+            else:
+                endpoint = healthy[self._roundRobin % len(healthy)]
+                self._roundRobin += 1
+            endpoint.inFlight += 1
+        return endpoint
+
+    def _releaseEndpoint(self, endpoint, latency):
+        """Internal Function: Record the outcome of a post, latency None meaning the receiver failed."""
+
+        if endpoint is None:
+            return
+        with self._endpointLock:
+            endpoint.inFlight -= 1
+            if latency is not None:
+                endpoint.latency = latency if not endpoint.latency else 0.8 * endpoint.latency + 0.2 * latency
+        if latency is None:
+            self._ejectEndpoint(endpoint)
+
+    def _ejectEndpoint(self, endpoint):
+        with self._endpointLock:
+            if not endpoint.ejected:
+                self.log.warn("Ejecting HEC receiver endpoint=%s",endpoint)
+            endpoint.ejected = True
+            endpoint.ejectedAt = time.time()
+            if self._probeThread is None:
+                self._probeThread = threading.Thread(target=self._endpointProbeThread, args=(self._stopEvent,))
+                self._probeThread.daemon = True
+                self._probeThread.start()
+
+    def _readmitEndpoint(self, endpoint):
+        with self._endpointLock:
+            if endpoint.ejected:
+                self.log.info("Re-admitting HEC receiver endpoint=%s",endpoint)
+            endpoint.ejected = False
+
+    def _endpointProbeThread(self, stop):
+        """Internal Function: Thread to health probe ejected receivers once endpointEjectSeconds have passed, until close()."""
+
+        while not stop.wait(1):
+            now = time.time()
+            for endpoint in self.endpoints:
+                if endpoint.ejected and endpoint.ejectedAt + self.endpointEjectSeconds <= now:
+                    if self._probe(endpoint):
+                        self._readmitEndpoint(endpoint)
+                    else:
+                        self._ejectEndpoint(endpoint)
+
+    def endpointStats(self):
+        """
+        Method to report the state of each HEC receiver.
+
+        Returns a list of dicts with endpoint, in_flight, latency_ms (moving average) and ejected.
+        """
+
+        with self._endpointLock:
+            return [{'endpoint':str(e), 'in_flight':e.inFlight, 'latency_ms':e.latency * 1000, 'ejected':e.ejected} for e in self.endpoints]
+
+    def _recordPost(self, status_code, latency, retries):
+        """Internal Function: Count one finished post, status_code None for a post that failed outright."""
+
+        bucket = 0
+        latency_ms = latency * 1000
+        while latency_ms > _latency_buckets_ms[bucket]:
+            bucket += 1
+        with self._statsLock:
+            self._batchesSent += 1
+            self._statusCounts[status_code] = self._statusCounts.get(status_code, 0) + 1
+            self._retries += retries
+            self._latencyCounts[bucket] += 1
+
+    def _recordDropped(self, batch, error=None):
+        """Internal Function: Count a dropped batch and fail the Future of a dropped sendEvent."""
+
+        with self._statsLock:
+            self._batchesDropped += 1
+            self._eventsDropped += batch.eventCount
+        if batch.future is not None and not batch.future.done():
+            batch.future.set_exception(error or Queue.Full("HEC send queue full, event dropped by backpressurePolicy"))
+
+    def stats(self):
+        """
+        Method to snapshot the collector's throughput and latency counters.
+
+        Returns dict with events_queued, bytes_queued, serialize_seconds, batches_sent, status_codes
+        (status code to count, None for posts that failed outright), retries, batches_dropped and events_dropped
+        (failed posts without a spool, plus backpressure drops), queue_depth, sender_threads, events_sampled_out, events_rate_dropped,
+        rate_limit_wait_seconds, events_collapsed, overflow_buffer_bytes and post_latency_ms percentiles p50, p90 and p99 (histogram bucket bounds).
+        """
+
+        with self._batchLock:
+            events, byteCount, serializeTime = self._eventsQueued, self._bytesQueued, self._serializeTime
+        with self._statsLock:
+            counts = list(self._latencyCounts)
+            snapshot = {'events_queued':events, 'bytes_queued':byteCount, 'serialize_seconds':serializeTime,
+                        'batches_sent':self._batchesSent, 'status_codes':dict(self._statusCounts), 'retries':self._retries,
+                        'batches_dropped':self._batchesDropped, 'events_dropped':self._eventsDropped}
+        snapshot['queue_depth'] = self.flushQueue.qsize()
+        snapshot['sender_threads'] = self._workers
+        with self._statsLock:
+            snapshot.update({'events_sampled_out':self._eventsSampledOut, 'events_rate_dropped':self._eventsRateDropped, 'rate_limit_wait_seconds':self._rateLimitWait})
+        snapshot['events_collapsed'] = self._eventsCollapsed
+        snapshot['overflow_buffer_bytes'] = self._overflowBytes
+        snapshot['post_latency_ms'] = dict((name, _histogram_percentile(counts, fraction)) for name, fraction in (('p50',0.5),('p90',0.9),('p99',0.99)))
+        return snapshot
+
+    def startStatsEmitter(self, interval=60, index=None, sourcetype='hec:client:stats'):
+        """
+        Method to send stats() to HEC every interval seconds as a multi-metric event.
+
+        The metrics event is posted straight to /services/collector/event so it works for raw collectors too,
+        and index should name a metrics index. close() stops it, it starts again when the collector is used again.
+        """
+
+        self._statsEmitter = (interval, index, sourcetype)
+        self._startStatsEmitter()
+
+    def _startStatsEmitter(self):
+        """Internal Function: Start the stats emitter thread set up by startStatsEmitter if it is not running."""
+
+        with self._workerLock:
+            if self._statsThread is None:
+                self._statsThread = threading.Thread(target=self._statsEmitterThread, args=self._statsEmitter + (self._stopEvent,))
+                self._statsThread.daemon = True
+                self._statsThread.start()
+
+    def _statsEmitterThread(self, interval, index, sourcetype, stop):
+        """Internal Function: Thread to post stats snapshots as HEC metrics until close()."""
+
+        protocol = 'https' if self.http_event_server_ssl else 'http'
+        while not stop.wait(interval):
+            snapshot = self.stats()
+            fields = {}
+            for name in ('events_queued','bytes_queued','serialize_seconds','batches_sent','retries','batches_dropped','events_dropped','queue_depth','overflow_buffer_bytes'):
+                fields['metric_name:hec.client.'+name] = snapshot[name]
+            for name, value in snapshot['post_latency_ms'].items():
+                fields['metric_name:hec.client.post_latency_ms.'+name] = value if value != float('inf') else -1
+            for status_code, count in snapshot['status_codes'].items():
+                fields['metric_name:hec.client.status.'+str(status_code or 'error')] = count
+            metric = {'time':round(time.time(),3), 'event':'metric', 'host':self.host, 'source':'splunk_http_event_collector', 'sourcetype':sourcetype, 'fields':fields}
+            if index:
+                metric['index'] = index
+            endpoint = next((e for e in self.endpoints if not e.ejected), self.endpoints[0])
             headers = {'Authorization':'Splunk '+self.token, 'X-Splunk-Request-Channel':str(uuid.uuid1())}
-            # try to post payload twice then give up and move on
             try:
-                response = self.requests_retry_session().post(self.server_uri, data=payload, headers=headers, verify=self.SSL_verify)
-                self.log.debug("batch_thread: http_status_code=%s http_message=%s",response.status_code,response.text)
+                self.session.post('%s://%s:%s/services/collector/event' % (protocol, endpoint.server, endpoint.port), data=json.dumps(metric), headers=headers, verify=self.SSL_verify)
             except Exception as e:
+                self.log.warn("Stats Emitter: failed to send stats.")
                 self.log.exception(e)
 
-            self.flushQueue.task_done()
-            
+    def _trackAck(self, endpoint, channel, response, batch):
+        """Internal Function: Record the ackId returned for a batch so the ack thread can confirm it."""
+
+        try:
+            ackId = response.json().get('ackId')
+        except ValueError:
+            ackId = None
+        if ackId is None:
+            self.log.debug("No ackId returned, check indexer acknowledgement is enabled on the HEC token.")
+            return
+
+        with self._ackLock:
+            # ackIds are only meaningful to the receiver that issued them
+            self._ackPending.setdefault((endpoint, channel), {})[ackId] = (batch, time.time())
+            if self._ackThread is None:
+                self._ackThread = threading.Thread(target=self._ackPollThread, args=(self._stopEvent,))
+                self._ackThread.daemon = True
+                self._ackThread.start()
+
+    def _ackPollThread(self, stop):
+        """Internal Function: Thread to check pending acknowledgements in bulk and resend expired batches, until close()."""
+
+        while not stop.wait(self.ackPollInterval):
+            with self._ackLock:
+                channels = dict((key, list(pending)) for key, pending in self._ackPending.items() if pending)
+            for (endpoint, channel), ackIds in channels.items():
+                self._checkAcks(endpoint, channel, ackIds)
+            self._resendExpired()
+
+    def _checkAcks(self, endpoint, channel, ackIds):
+        """Internal Function: Query /services/collector/ack for one channel and retire acknowledged batches."""
+
+        protocol = 'https' if self.http_event_server_ssl else 'http'
+        server, port = (endpoint.server, endpoint.port) if endpoint is not None else (self.http_event_server, self.http_event_port)
+        ack_uri = '%s://%s:%s/services/collector/ack?channel=%s' % (protocol, server, port, channel)
+        headers = {'Authorization':'Splunk '+self.token, 'X-Splunk-Request-Channel':channel}
+        try:
+            response = self.session.post(ack_uri, data=json.dumps({'acks':ackIds}), headers=headers, verify=self.SSL_verify)
+            acks = response.json().get('acks', {})
+        except Exception as e:
+            self.log.warn("Ack Check: failed channel=%s",channel)
+            self.log.exception(e)
+            return
+
+        now = time.time()
+        with self._ackLock:
+            pending = self._ackPending.get((endpoint, channel), {})
+            for ackId in ackIds:
+                if acks.get(str(ackId)) and ackId in pending:
+                    batch, sent = pending.pop(ackId)
+                    latency = now - sent
+                    self._ackCount += 1
+                    self._ackLatencyTotal += latency
+                    self._ackLatencyMax = max(self._ackLatencyMax, latency)
+
+    def _resendExpired(self):
+        """Internal Function: Put batches not acknowledged within ackTimeout back on the flushQueue."""
+
+        expired = []
+        deadline = time.time() - self.ackTimeout
+        with self._ackLock:
+            for pending in self._ackPending.values():
+                for ackId in [ackId for ackId, (batch, sent) in pending.items() if sent < deadline]:
+                    expired.append(pending.pop(ackId)[0])
+            self._ackRedelivered += len(expired)
+
+        for batch in expired:
+            self.log.warn("Ack Timeout: resending batch of %s events.",batch.eventCount)
+            self._enqueue(batch)
+
+    def ackStats(self):
+        """
+        Method to report indexer acknowledgement progress when useAck is enabled.
+
+        Returns dict with in_flight (batches awaiting ack), acknowledged, redelivered and ack latency average and max in seconds.
+        """
+
+        with self._ackLock:
+            inFlight = sum(len(pending) for pending in self._ackPending.values())
+            count = self._ackCount
+            average = self._ackLatencyTotal / count if count else 0.0
+            return {'in_flight':inFlight, 'acknowledged':count, 'redelivered':self._ackRedelivered, 'latency_avg':average, 'latency_max':self._ackLatencyMax}
+
+    def waitForAcks(self, timeout=None):
+        """
+        Method to block until every sent batch has been acknowledged, or timeout seconds pass.
+
+        Call after flushBatch() when useAck is enabled. Returns True if nothing is left awaiting acknowledgement.
+        """
+
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            self._waitUntilDone()
+            if not self.ackStats()['in_flight']:
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(min(self.ackPollInterval, 0.1))
+
+    def _batchByteLimit(self):
+        """Internal Function: Uncompressed byte budget for the current batch."""
+
+        maxByteLength = self._adaptiveByteLength if self.adaptive else self.maxByteLength
+        if not (self.compressBatches and self.limitCompressedSize):
+            return maxByteLength
+        # Compressed size is only known after the sending thread gzips the batch,
+        # so scale the limit by the ratio observed on previous batches.
+        ratio = self.compressionStats()['compression_ratio']
+        return int(maxByteLength * max(ratio, 1.0))
+
+    def _acquireSendSlot(self):
+        """Internal Function: Block the sending thread while the adaptive concurrency limit is reached."""
+
+        with self._sendGate:
+            while self._sending >= self._adaptiveConcurrency:
+                self._sendGate.wait()
+            self._sending += 1
+
+    def _releaseSendSlot(self):
+        with self._sendGate:
+            self._sending -= 1
+            self._sendGate.notify()
+
+    def _adaptiveUpdate(self, latency, busy):
+        """
+        Internal Function: AIMD step after each post.
+
+        Fast successful posts grow the batch size by adaptiveByteStep and, once per window of posts,
+        the concurrency by one. A 429/503, a failed post or latency over adaptiveTargetLatency halves both.
+        """
+
+        with self._sendGate:
+            self._adaptiveLatency = latency if not self._adaptiveLatency else 0.8 * self._adaptiveLatency + 0.2 * latency
+            if busy or latency > self.adaptiveTargetLatency:
+                if busy:
+                    self._adaptiveBusy += 1
+                self._adaptiveByteLength = max(self.adaptiveMinByteLength, self._adaptiveByteLength // 2)
+                self._adaptiveConcurrency = max(1, self._adaptiveConcurrency // 2)
+                self._adaptiveWindow = 0
+                return
+            self._adaptiveByteLength = min(self.adaptiveMaxByteLength or self.maxByteLength, self._adaptiveByteLength + self.adaptiveByteStep)
+            self._adaptiveWindow += 1
+            if self._adaptiveWindow >= self._adaptiveConcurrency:
+                self._adaptiveWindow = 0
+                if self._adaptiveConcurrency < self.threadCount:
+                    self._adaptiveConcurrency += 1
+                    self._sendGate.notify()
+
+    def adaptiveStats(self):
+        """
+        Method to report the live settings chosen by the adaptive controller.
+
+        Returns dict with max_byte_length, concurrency, latency_ms (moving average) and busy_responses (429/503 or failed posts).
+        """
+
+        with self._sendGate:
+            return {'max_byte_length':self._adaptiveByteLength, 'concurrency':self._adaptiveConcurrency, 'latency_ms':self._adaptiveLatency * 1000, 'busy_responses':self._adaptiveBusy}
+
+    def _compress(self, payload):
+        """Internal Function: gzip a batch body and record the ratio and CPU time spent."""
+
+        start = _cpu_clock()
+        # wbits 31 makes zlib write a gzip header and trailer
+        compressor = zlib.compressobj(self.compressLevel, zlib.DEFLATED, 31)
+        compressed = compressor.compress(payload) + compressor.flush()
+        elapsed = _cpu_clock() - start
+        with self._compressLock:
+            self._compressBytesIn += len(payload)
+            self._compressBytesOut += len(compressed)
+            self._compressCPUTime += elapsed
+        return compressed
+
+    def compressionStats(self):
+        """
+        Method to report gzip totals for batches sent with compressBatches enabled.
+
+        Returns dict with bytes_in, bytes_out, compression_ratio (bytes_in / bytes_out) and cpu_seconds spent compressing.
+        """
+
+        with self._compressLock:
+            bytesIn = self._compressBytesIn
+            bytesOut = self._compressBytesOut
+            cpuTime = self._compressCPUTime
+        ratio = float(bytesIn) / bytesOut if bytesOut else 1.0
+        return {'bytes_in':bytesIn, 'bytes_out':bytesOut, 'compression_ratio':ratio, 'cpu_seconds':cpuTime}
+
+    def enableSpool(self, directory, maxBytes=1024*1024*1024, segmentBytes=16*1024*1024, overflow=False):
+        """
+        Method to keep batches that fail delivery in an on-disk spool instead of dropping them.
+
+        Keyword Arguments:
+            directory -- folder for spool segment files, created if missing. Segments from a previous run are replayed.
+            maxBytes -- total spool size cap, oldest segments are deleted beyond it (default 1GB)
+            segmentBytes -- size at which a new segment file is started (default 16MB)
+            overflow -- boolean flag to also spool batches when the flushQueue is full instead of blocking (default false)
+
+        A background thread replays the spool once check_connectivity succeeds, checking every spoolReplayInterval seconds.
+        """
+
+        self._spool = _disk_spool(directory, maxBytes, segmentBytes)
+        self._spoolOverflow = overflow
+        self._startSpoolReplay()
+
+    def _startSpoolReplay(self):
+        """Internal Function: Start the spool replay thread if it is not running."""
+
+        with self._workerLock:
+            if self._spoolThread is None:
+                self._spoolThread = threading.Thread(target=self._spoolReplayThread, args=(self._stopEvent,))
+                self._spoolThread.daemon = True
+                self._spoolThread.start()
+
+    def _spoolBatch(self, batch):
+        """Internal Function: Write a batch to the disk spool."""
+
+        if self._spoolThread is None:
+            self._startSpoolReplay()
+        try:
+            self._spool.append(batch, batch.eventCount, batch.destination)
+        except Exception as e:
+            self.log.error("Spool write failed, dropping batch of %s events.",batch.eventCount)
+            self.log.exception(e)
+
+    def _spoolReplayThread(self, stop):
+        """Internal Function: Thread to drain the disk spool back onto the flushQueue once HEC is reachable, until close()."""
+
+        while not stop.is_set():
+            try:
+                if self._spool.segments and self.check_connectivity():
+                    # Only drain what is spooled now, batches that fail again are spooled for the next pass
+                    for x in range(len(self._spool.segments)):
+                        records = self._spool.takeOldest()
+                        self.log.info("Spool Replay: queueing %s spooled batches.",len(records))
+                        for body, eventCount, destination in records:
+                            self.flushQueue.put(_batch_buffer(body, destination, eventCount))
+                            self._ensureWorkers()
+            except Exception as e:
+                # e.g. a corrupt segment, which takeOldest has moved aside, the rest is replayed on the next pass
+                self.log.error("Spool Replay: replay pass failed.")
+                self.log.exception(e)
+            stop.wait(self.spoolReplayInterval)
+
+    def spoolStats(self):
+        """
+        Method to report disk spool usage when enableSpool has been called.
+
+        Returns dict with bytes and segments on disk and counts of batches spooled, replayed and evicted by the size cap.
+        """
+
+        if self._spool is None:
+            return {'bytes':0, 'segments':0, 'spooled':0, 'replayed':0, 'evicted':0}
+        with self._spool.lock:
+            return {'bytes':self._spool.byteSize, 'segments':len(self._spool.segments), 'spooled':self._spool.spooled, 'replayed':self._spool.replayed, 'evicted':self._spool.evicted}
+
     def _waitUntilDone(self):
-        """Internal Function: Block until all flushQueue is empty."""
-        self.flushQueue.join()
-        return
+        """Internal Function: Block until all flushQueue is empty. Sends on this thread when a sender thread could not be started."""
+
+        if not self._senderStartFailed:
+            self.flushQueue.join()
+            return
+        self._sendInline()
+
+    def _sendInline(self, deadline=None):
+        """Internal Function: Send queued batches on the calling thread whenever no sender thread is alive, until the queue is done or deadline passes."""
+
+        ackChannel = str(uuid.uuid1())
+        while self.flushQueue.unfinished_tasks and (deadline is None or time.time() < deadline):
+            if self._workers:
+                time.sleep(0.05)
+                continue
+            try:
+                batch = self.flushQueue.get_nowait()
+            except Queue.Empty:
+                time.sleep(0.05)
+                continue
+            if batch is not None:
+                self._sendBatch(batch, ackChannel)
+            self.flushQueue.task_done()
 
 
     def flushBatch(self):
@@ -277,11 +2173,226 @@ class http_event_collector:
            Always call this method before exiting your code to send any partial batch queue.
         """
 
+        self._queuePartialBatches()
+        self._waitUntilDone()
+
+    def _queuePartialBatches(self):
+        """Internal Function: Queue the partial batch, every destination batch and pending metrics without waiting."""
+
+        self._flushMetrics()
+        self._flushDuplicates()
         self.log.debug("Manual Flush: Sticking the batch on the queue.")
-        self.flushQueue.put(self.batchEvents)
-        self.batchEvents = []
-        self.currentByteLength = 0
+        with self._batchLock:
+            batches = [self._takeBatch()] + list(self._destinations.values())
+            self._destinations = {}
+        for batch in batches:
+            if batch:
+                self._enqueue(batch)
+
+    def close(self):
+        """
+        Method to flush every batch, then stop the sender and background threads, release pooled connections and shut down the process pool.
+
+        The collector can still be used afterwards, threads and connections are started again on demand.
+        Also called when leaving a with block.
+        """
+
+        self.flushBatch()
+        # one stop marker per sender, put under the lock so none of them can idle out and leave a marker behind
+        with self._workerLock:
+            for x in range(self._workers):
+                self.flushQueue.put_nowait(None)
         self._waitUntilDone()
+        # threads hold the stop event they were started with, so ones started after this get the new event and keep running
+        stop, self._stopEvent = self._stopEvent, threading.Event()
+        stop.set()
+        threads = [self._lingerThread, self._dedupThread, self._metricThread, self._ackThread, self._probeThread, self._spoolThread, self._statsThread]
+        self._lingerThread = self._dedupThread = self._metricThread = self._ackThread = self._probeThread = self._spoolThread = self._statsThread = None
+        self._closed = True
+        for t in threads:
+            # a thread in the middle of a post or probe is not waited for, it exits once that returns
+            if t is not None and t is not threading.current_thread():
+                t.join(1)
+        if self._processPool is not None:
+            self._processPool.shutdown()
+            self._processPool = None
+        with self._sessionLock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def flushAtExit(self, timeout=10):
+        """
+        Method to register an interpreter exit hook that sends queued and partial batches, waiting at most timeout seconds.
+
+        Sender threads are daemons, so without flushBatch, close or this hook anything still queued is lost at exit.
+        """
+
+        atexit.register(self._atexitFlush, timeout)
+
+    def _atexitFlush(self, timeout):
+        """Internal Function: Exit hook, sends remaining batches on this thread when no sender thread is left to do it."""
+
+        self._queuePartialBatches()
+        self._sendInline(time.time() + timeout)
+        if self.flushQueue.unfinished_tasks:
+            self.log.warn("Exit Flush: gave up after %s seconds with %s batches unsent.",timeout,self.flushQueue.unfinished_tasks)
+
+
+class HECHandler(logging.Handler):
+
+    """
+        logging.Handler sending log records to Splunk through an http_event_collector.
+
+        emit() only renders msg % args and appends it with the LogRecord to an in-memory buffer, so the logging
+        call never serializes or waits on the send queue. A background thread formats the buffered records, builds CIM friendly events and
+        hands them to the collector's batchEvents, so the collector's batching, maxLingerMs and backpressure apply.
+        flush() and close(), both called by logging.shutdown at exit, send whatever is still buffered.
+
+        Keyword Arguments:
+            collector -- the http_event_collector to send through - required
+            level -- minimum level handled (default NOTSET)
+            index -- optional index for the events (default None, the collector or token default)
+            sourcetype -- optional sourcetype for the events (default None)
+            source -- optional source for the events (default None, the logger name)
+
+        Attributes:
+            flushInterval -- seconds between background drains of the buffer (default 0.5)
+            wakeCount -- buffered records that wake the background thread before flushInterval (default 5000)
+            maxBuffered -- records held before emit starts dropping new ones, see dropped (default 100000)
+            deferFormatting -- boolean flag to render msg % args on the background thread instead of in emit (default false).
+                               Only turn it on when args are never mutated after the logging call, or the event carries the later value.
+            excludeLoggers -- logger name prefixes never sent, to keep the collector's own and HTTP client logging from looping back
+
+        Events carry message, severity, severity_id, logger, thread, process_id, module, function and line fields,
+        plus exception and exception_type when exc_info is set.
+        A Formatter set with setFormatter renders the message field instead of msg % args.
+
+        Example:
+            handler = HECHandler(testevent, index="test", sourcetype="python:logging")
+            logging.getLogger().addHandler(handler)
+    """
+
+    excludeLoggers = ('HEC', 'urllib3', 'requests')
+
+    def __init__(self, collector, level=logging.NOTSET, index=None, sourcetype=None, source=None):
+        logging.Handler.__init__(self, level)
+        self.collector = collector
+        self.index = index
+        self.sourcetype = sourcetype
+        self.source = source
+        self.flushInterval = 0.5
+        self.wakeCount = 5000
+        self.maxBuffered = 100000
+        self.deferFormatting = False
+        self.dropped = 0
+        self._buffer = collections.deque()
+        self._wake = threading.Event()
+        self._drainLock = threading.Lock()
+        self._closed = False
+        t = threading.Thread(target=self._drainThread)
+        t.daemon = True
+        t.start()
+
+    def emit(self, record):
+        """Buffer the record for the background thread. The only work done on the logging thread."""
+
+        if record.name.startswith(self.excludeLoggers):
+            return
+        buffered = len(self._buffer)
+        if buffered >= self.maxBuffered:
+            self.dropped += 1
+            return
+        # the rendered message is kept beside the record, which other handlers may still be using
+        self._buffer.append((record, None if self.deferFormatting else record.getMessage()))
+        if buffered == self.wakeCount:
+            self._wake.set()
+
+    def _drainThread(self):
+        """Internal Function: Thread to hand buffered records to the collector every flushInterval seconds."""
+
+        while not self._closed:
+            self._wake.wait(self.flushInterval)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        """Internal Function: Render every buffered record and batch it on the collector."""
+
+        with self._drainLock:
+            if self._buffer:
+                try:
+                    self.collector.batchEvents(self._render())
+                except Exception as e:
+                    self.collector.log.exception(e)
+
+    def _render(self):
+        """Internal Function: Generator popping buffered records and turning them into HEC payloads."""
+
+        buffer = self._buffer
+        isJson = self.collector.input_type == 'json'
+        while True:
+            try:
+                record, message = buffer.popleft()
+            except IndexError:
+                return
+            if not isJson:
+                yield self._message(record, message, True)
+                continue
+            yield self._payload(record, message)
+
+    def _message(self, record, message, formatted):
+        """Internal Function: The record's text, from the message rendered in emit when there is one. formatted applies the handler's Formatter."""
+
+        if message is None:
+            return self.format(record) if formatted else record.getMessage()
+        if not formatted:
+            return message
+        snapshot = copy.copy(record)
+        snapshot.msg = message
+        snapshot.args = None
+        return self.format(snapshot)
+
+    def _payload(self, record, message=None):
+        """Internal Function: CIM friendly HEC payload for one LogRecord, message being the text rendered in emit if any."""
+
+        message = self._message(record, message, self.formatter is not None)
+        event = {'message':message, 'severity':record.levelname.lower(), 'severity_id':record.levelno, 'logger':record.name,
+                 'thread':record.threadName, 'process_id':record.process, 'module':record.module, 'function':record.funcName, 'line':record.lineno}
+        if record.exc_info and record.exc_info[0] is not None:
+            event['exception_type'] = record.exc_info[0].__name__
+            event['exception'] = record.exc_text or _log_formatter.formatException(record.exc_info)
+        payload = {'time':'%.3f' % record.created, 'host':self.collector.host, 'source':self.source or record.name, 'event':event}
+        if self.index:
+            payload['index'] = self.index
+        if self.sourcetype:
+            payload['sourcetype'] = self.sourcetype
+        return payload
+
+    def flush(self):
+        """Send every buffered record and wait until the collector has delivered them."""
+
+        self._drain()
+        self.collector.flushBatch()
+
+    def close(self):
+        """Flush and stop the background thread. Called by logging.shutdown at interpreter exit."""
+
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            self.flush()
+        logging.Handler.close(self)
+
+
+# Formats exc_info tracebacks for HECHandler when the record has no exc_text yet
+_log_formatter = logging.Formatter()
 
 def main():
 
@@ -0,0 +1,288 @@
+"""splunk_http_event_collector_async.py
+    asyncio Splunk HTTP event submission class
+
+    Same payload handling as splunk_http_event_collector.http_event_collector, but batches are posted
+    from the event loop over a small pool of keep-alive connections instead of sender threads.
+    Requires Python 3.7+ and no packages beyond the standard library.
+
+    Remember: Friends don't let friends send in non Common Information Model data: http://docs.splunk.com/Documentation/CIM/latest/User/Overview
+        Please use CIM friendly field names when sending in data.
+"""
+
+__author__ = "george@georgestarcher.com (George Starcher)"
+
+import asyncio
+import logging
+import socket
+import ssl
+import uuid
+
+from urllib.parse import urlsplit
+
+from splunk_http_event_collector import http_event_collector, _json_dumps, _to_bytes
+
+
+class _HECConnectionPool:
+
+    """Internal Class: keep-alive HTTP/1.1 connections to one HEC server, at most poolSize open at once."""
+
+    def __init__(self, host, port, use_ssl, verify, poolSize):
+        self.host = host
+        self.port = int(port)
+        self.ssl = None
+        if use_ssl:
+            self.ssl = ssl.create_default_context()
+            if not verify:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl.CERT_NONE
+        self._idle = []
+        self._slots = asyncio.Semaphore(poolSize)
+
+    async def request(self, path, body, headers):
+        """Send one POST and return (status_code, response_text)."""
+
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+            try:
+                status, text, keepAlive = await self._exchange(reader, writer, path, body, headers)
+            except BaseException:
+                writer.close()
+                raise
+            if keepAlive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return (status, text)
+
+    async def _exchange(self, reader, writer, path, body, headers):
+        lines = ['POST %s HTTP/1.1' % path, 'Host: %s:%s' % (self.host, self.port), 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % (k, v) for k, v in headers.items())
+        # header and body are written separately so the batch buffer is not copied into one request string
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+        statusLine = await reader.readline()
+        if not statusLine:
+            raise ConnectionError("HEC closed the connection")
+        status = int(statusLine.split()[1])
+        responseHeaders = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            responseHeaders[name.strip().lower()] = value.strip()
+
+        keepAlive = responseHeaders.get('connection', '').lower() != 'close'
+        if 'content-length' in responseHeaders:
+            data = await reader.readexactly(int(responseHeaders['content-length']))
+        elif responseHeaders.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await reader.read()
+            keepAlive = False
+        return (status, data.decode('utf-8', 'replace'), keepAlive)
+
+    def close(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+
+class async_http_event_collector:
+
+    """
+        asyncio Splunk HTTP Event Collector Class
+
+        Keyword Arguments:
+            token -- the Splunk HEC token value - required
+            http_event_server -- the Splunk Server name or ip. Name must be network resolvable. - required
+            input_type -- json or raw HEC type - provided at init (default json)
+            host -- value to use as host field for events sent to Splunk (default the local system's hostname)
+            http_event_port -- Splunk HEC network port (default 8088)
+            http_event_server_ssl -- boolean to set if Splunk HEC is using SSL (default True)
+
+        Attributes:
+            SSL_verify -- boolean flag to force SSL certificate verification (default false)
+            popNullFields -- boolean flag to pop null fields off payload prior to sending to Splunk (default false)
+            serializer -- callable turning a JSON payload dict into a string (default fastest of orjson, ujson, json)
+            index -- optional index name for HEC events (default None)
+            sourcetype -- optional sourcetype name for HEC events (default None)
+            server_uri -- computed property for HEC uri based on HEC type, raw metadata etc.
+            maxInFlight -- number of batches posted concurrently, also the size of the connection pool (default 10)
+
+        Example:
+            from splunk_http_event_collector_async import async_http_event_collector
+
+            async with async_http_event_collector("4D14F8D9-D788-4E6E-BF2D-D1A46441242E","localhost") as hec:
+                await hec.batch_event({"event":{"action":"success"}})
+     """
+
+    # Same batch limit as the threaded class
+    maxByteLength = http_event_collector.maxByteLength
+    # Concurrent in-flight posts, the asyncio counterpart to threadCount
+    maxInFlight = http_event_collector.threadCount
+    # Retry policy matching http_event_collector.requests_retry_session
+    retries = 3
+    backoffFactor = 0.3
+    retryStatusCodes = (408,500,502,503,504)
+
+    server_uri = http_event_collector.server_uri
+    _buildUri = http_event_collector._buildUri
+    _formatEvent = http_event_collector._formatEvent
+
+    def __init__(self,token,http_event_server,input_type='json',host="",http_event_port='8088',http_event_server_ssl=True):
+
+        self.log = logging.getLogger(u'HEC')
+
+        self.token = token
+        self.SSL_verify = False
+        self.http_event_server = http_event_server
+        self.http_event_server_ssl = http_event_server_ssl
+        self.http_event_port = http_event_port
+        self.index = ""
+        self.sourcetype = ""
+        self._batchEvents = bytearray()
+        self.currentByteLength = 0
+        self.input_type = input_type
+        self.popNullFields = False
+        self.serializer = _json_dumps
+        self._pool = None
+        self._inFlight = None
+        self._pending = set()
+
+        # Set host to specified value or default to localhostname if no value provided
+        if host:
+            self.host = host
+        else:
+            self.host = socket.gethostname()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _getPool(self):
+        if self._pool is None:
+            self._pool = _HECConnectionPool(self.http_event_server, self.http_event_port, self.http_event_server_ssl, self.SSL_verify, self.maxInFlight)
+            self._inFlight = asyncio.Semaphore(self.maxInFlight)
+        return self._pool
+
+    async def _post(self, body):
+        """Internal Function: POST a body with retries, returns (status_code, response_text)."""
+
+        uri = urlsplit(self.server_uri)
+        path = uri.path + ('?' + uri.query if uri.query else '')
+        headers = {'Authorization':'Splunk '+self.token, 'X-Splunk-Request-Channel':str(uuid.uuid1())}
+        pool = self._getPool()
+        for attempt in range(self.retries + 1):
+            try:
+                status, text = await pool.request(path, body, headers)
+                if status not in self.retryStatusCodes or attempt == self.retries:
+                    return (status, text)
+            except (OSError, asyncio.IncompleteReadError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoffFactor * (2 ** attempt))
+
+    async def check_connectivity(self):
+        """
+        method to check connectivity to Splunk HEC
+
+        Same rules as http_event_collector.check_connectivity: 400/401/403 responses count as reachable.
+        """
+
+        self.log.info("Checking HEC Server URI reachability.")
+        try:
+            status, text = await self._post(b'')
+        except Exception as e:
+            self.log.warning("Splunk Server URI is unreachable.")
+            self.log.exception(e)
+            return False
+        if status < 400 or status in (400,401,403):
+            self.log.info("Splunk Server URI is reachable.")
+            if status >= 400:
+                self.log.warning("Connectivity Check: http_status_code=%s http_message=%s",status,text)
+            return True
+        if status in (500,503):
+            self.log.warning("Splunk HEC Server has potential health issues")
+        else:
+            self.log.warning("Splunk Server URI is unreachable.")
+        self.log.error("Connectivity Check: http_status_code=%s http_message=%s",status,text)
+        return False
+
+    async def send_event(self,payload,eventtime=""):
+        """Method to immediately send one event. Returns (status_code, response_text)."""
+
+        body = _to_bytes(self._formatEvent(payload, eventtime))
+        self._getPool()
+        async with self._inFlight:
+            return await self._post(body)
+
+    async def batch_event(self,payload,eventtime=""):
+        """
+        Recommended Method to add an event to the current batch. Full batches are posted in the background.
+
+        Awaits only when maxInFlight batches are already being posted, the loop is never blocked.
+        """
+
+        data = _to_bytes(self._formatEvent(payload, eventtime, lineBreak=True))
+        payloadLength = len(data)
+
+        if self._batchEvents and (self.currentByteLength+payloadLength) > self.maxByteLength:
+            self.log.debug("Auto Flush: Posting the batch.")
+            await self._submit(self._takeBatch())
+
+        self._batchEvents.extend(data)
+        self.currentByteLength += payloadLength
+
+    def _takeBatch(self):
+        batch = self._batchEvents
+        self._batchEvents = bytearray()
+        self.currentByteLength = 0
+        return batch
+
+    async def _submit(self, batch):
+        """Internal Function: Wait for an in-flight slot and post the batch as a background task."""
+
+        self._getPool()
+        await self._inFlight.acquire()
+        task = asyncio.ensure_future(self._sendBatch(batch))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _sendBatch(self, body):
+        try:
+            status, text = await self._post(body)
+            self.log.debug("batch_task: http_status_code=%s http_message=%s",status,text)
+        except Exception as e:
+            self.log.exception(e)
+        finally:
+            self._inFlight.release()
+
+    async def flush(self):
+        """Method to post the partial batch and wait until every in-flight batch has completed."""
+
+        if self._batchEvents:
+            self.log.debug("Manual Flush: Posting the batch.")
+            await self._submit(self._takeBatch())
+        if self._pending:
+            await asyncio.gather(*list(self._pending))
+
+    async def close(self):
+        """Method to flush remaining events and close pooled connections."""
+
+        await self.flush()
+        if self._pool is not None:
+            self._pool.close()
@@ -0,0 +1,66 @@
+"""test_exit_flush.py
+    Batches still queued when the interpreter exits must be delivered, and exit must not hang.
+
+    Python 3.12+ refuses to start threads during interpreter shutdown, so exit hooks that queue a batch
+    (logging.shutdown closing a HECHandler, atexit.register(flushBatch)) find no sender thread to drain it.
+    Each case runs a child interpreter against a stub HEC in a third process and checks the events arrived.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STUB = os.path.join(ROOT, 'benchmarks', 'stub_hec.py')
+
+CHILD_PREFIX = """
+import atexit, logging, sys
+sys.path.insert(0, %r)
+from splunk_http_event_collector import http_event_collector, HECHandler
+collector = http_event_collector("token", "127.0.0.1", http_event_port=int(sys.argv[1]), http_event_server_ssl=False)
+""" % ROOT
+
+
+class exitFlushTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = subprocess.Popen([sys.executable, STUB, '--port', '0'], stdout=subprocess.PIPE, universal_newlines=True)
+        self.port = self.stub.stdout.readline().strip().rsplit(':', 1)[1]
+
+    def tearDown(self):
+        if self.stub.poll() is None:
+            self.stub.kill()
+            self.stub.wait()
+
+    def stubEvents(self):
+        self.stub.send_signal(signal.SIGINT)
+        summary = self.stub.communicate(timeout=10)[0]
+        return int(summary.split('events=')[1].split()[0])
+
+    def runChild(self, body):
+        child = subprocess.run([sys.executable, '-c', CHILD_PREFIX + textwrap.dedent(body), self.port], timeout=30)
+        self.assertEqual(child.returncode, 0)
+
+    def test_handler_flushed_by_logging_shutdown(self):
+        self.runChild("""
+            log = logging.getLogger("app")
+            log.setLevel(logging.INFO)
+            log.addHandler(HECHandler(collector))
+            log.info("hello")
+        """)
+        self.assertEqual(self.stubEvents(), 1)
+
+    def test_flushBatch_registered_with_atexit(self):
+        self.runChild("""
+            atexit.register(collector.flushBatch)
+            for i in range(10):
+                collector.batchEvent({"event":i})
+        """)
+        self.assertEqual(self.stubEvents(), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
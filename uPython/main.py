@@ -21,9 +21,15 @@ testeventJSON.set_ntp_time()
 # If you want to not include timestamp in json payloads force the HEC object to not include time
 # testeventJSON.includeTime = False
 
-# Add 5 test events
+# Optionally keep batches on flash while the network is down, they are resent after the next successful post
+# testeventJSON.spoolFile = "hec.spool"
+
+# Batch 5 test events, they go out together in one post over a kept alive connection
 for i in range(5):
     payload.update({"event":{"action":"success","type":"json","message":"hello world","event_id":i}})
-    testeventJSON.sendEvent(payload)
+    testeventJSON.batchEvent(payload)
+
+# Send the partial batch and close the connection before exiting or going to deep sleep
+testeventJSON.close()
 
 sys.exit(0)
@@ -9,20 +9,18 @@ import sys
 
 try:
     import json
+    import os
+    import socket
     import time
 except ImportError as err_msg:
     print(err_msg)
     sys.exit(1)
 
-# requests library is required for this class
+# ssl is only needed for https HEC endpoints
 try:
-    import requests
+    import ssl
 except ImportError:
-    try:
-        import urequests as requests
-    except ImportError as err_msg:
-        print(err_msg)
-        sys.exit(1)
+    ssl = None
 
 # setting ntptime is optional for this class
 try:
@@ -30,20 +28,56 @@ try:
 except ImportError as err_msg:
     print(err_msg)
 
+# millisecond ticks that survive wrap around on boards, plain wall clock elsewhere
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    def ticks_ms():
+        return int(time.time() * 1000)
+
+    def ticks_diff(new, old):
+        return new - old
+
 
 __author__ = "george@georgestarcher.com (George Starcher)"
-http_event_collector_debug = True 
+http_event_collector_debug = False
+
+# Ports with an embedded epoch count seconds from 2000-01-01, Splunk expects POSIX seconds from 1970
+timeOffsetForEmbeddedEpoch = 946684800 if time.gmtime(0)[0] == 2000 else 0
 
 class http_event_collector:
 
-    def __init__(self,token,http_event_server,input_type='json',host="",http_event_port='8088',http_event_server_ssl=True):
+    """
+        MicroPython Splunk HTTP Event Collector Class
+
+        Keyword Arguments:
+            token -- the Splunk HEC token value - required
+            http_event_server -- the Splunk Server name or ip - required
+            input_type -- json or raw HEC type (default json)
+            host -- value to use as host field for events (default micropython)
+            http_event_port -- Splunk HEC network port (default 8088)
+            http_event_server_ssl -- boolean to set if Splunk HEC is using SSL (default True)
+            bufferSize -- bytes preallocated once for the batch buffer, a batch is sent when the next event would not fit (default 2048)
+
+        Attributes:
+            includeTime -- boolean flag to add the local timestamp to json events (default True)
+            flushInterval -- seconds after which batchEvent or poll sends a partial batch (default 30)
+            spoolFile -- optional flash file path batches are appended to when a send fails, resent after the next successful send (default None)
+            spoolMaxBytes -- size cap of spoolFile, batches that do not fit are dropped (default 32768)
+            dropped -- count of batches lost because the send failed and the spool was off or full
+    """
+
+    def __init__(self,token,http_event_server,input_type='json',host="",http_event_port='8088',http_event_server_ssl=True,bufferSize=2048):
         self.token = token
         self.currentByteLength = 0
         self.input_type = input_type
+        self.http_event_server = http_event_server
+        self.http_event_port = int(http_event_port)
+        self.http_event_server_ssl = http_event_server_ssl
 
         # Flip to False if you do not want time included in the events sent to Splunk.
         # This will cause time indexed to be the local time of the HEC receiver
-        self.includeTime = True 
+        self.includeTime = True
 
         # Set host to specified value or default to micropython if no value provided
         if host:
@@ -51,6 +85,17 @@ class http_event_collector:
         else:
             self.host = 'micropython'
 
+        # The batch buffer is allocated once and reused so batching does not fragment the heap
+        self._buffer = bytearray(bufferSize)
+        self._view = memoryview(self._buffer)
+        self._batchStarted = 0
+        self.flushInterval = 30
+        self.spoolFile = None
+        self.spoolMaxBytes = 32768
+        self.dropped = 0
+        self._sock = None
+        self._stream = None
+
         # Build and set server_uri for http event collector
         # Defaults to SSL if flag not passed
         # Defaults to port 8088 if port not passed
@@ -64,19 +109,16 @@ class http_event_collector:
             input_url = '/raw?channel='+str('uuid')
         else:
             input_url = '/event'
-            
-        self.server_uri = '%s://%s:%s/services/collector%s' % (protocol, http_event_server, http_event_port, input_url)
+
+        self.path = '/services/collector%s' % input_url
+        self.server_uri = '%s://%s:%s%s' % (protocol, http_event_server, http_event_port, self.path)
 
         if http_event_collector_debug:
-            print(self.token)
             print(self.server_uri)
-            print(self.input_type)               
-
-    def sendEvent(self,payload,eventtime=""):
-        # Method to immediately send an event to the http event collector
-
-        headers = {'Authorization':'Splunk '+self.token}
+            print(self.input_type)
 
+    def _formatEvent(self,payload,eventtime=""):
+        # Render one payload as the UTF-8 bytes sent to HEC
 
         if self.input_type == 'json':
             # Fill in local hostname if not manually populated
@@ -85,34 +127,220 @@ class http_event_collector:
 
             # if self.includeTime is set to True then include the local system timestamp
             # If eventtime in epoch not passed as optional argument and not in payload, use current system time in epoch
-            # Note that epoch for embedded systems do not match epoch for POSIX that Splunk expects. 
+            # Note that epoch for embedded systems do not match epoch for POSIX that Splunk expects.
             # We adjust for the offset difference.
             # Reference: https://docs.micropython.org/en/latest/pyboard/library/utime.html
 
             if self.includeTime and not eventtime and 'time' not in payload:
-                timeOffsetForEmbeddedEpoch = 946684800 
                 eventtime = str(int(time.time()+timeOffsetForEmbeddedEpoch))
                 payload.update({"time":eventtime})
 
-            # Fill in local hostname if not manually populated
-            if 'host' not in payload:
-                payload.update({"host":self.host})
+            return json.dumps(payload).encode()
 
-        # send event to http event collector
-        event = []
-        if self.input_type == 'json':
-            event.append(json.dumps(payload))
-        else:
-            event.append(str(payload))
+        data = str(payload).encode()
+        if not data.endswith(b"\n"):
+            data = data + b"\n"
+        return data
+
+    def sendEvent(self,payload,eventtime=""):
+        # Method to immediately send an event to the http event collector
+        # Returns the HTTP status code, or None if the send failed
+
+        data = self._formatEvent(payload, eventtime)
 
         if http_event_collector_debug:
             print("Single Submit:")
-            print(event[0])
+            print(data)
 
-        r = requests.post(self.server_uri, data=event[0], headers=headers)
-        print(r.text)
+        return self._send(data)
 
-        return()
+    def batchEvent(self,payload,eventtime=""):
+        # Method to add an event to the preallocated batch buffer
+        # The batch is sent when the next event would not fit, or when flushInterval has passed
+
+        data = self._formatEvent(payload, eventtime)
+        length = len(data)
+
+        if self.currentByteLength + length > len(self._buffer):
+            self.flush()
+        if length > len(self._buffer):
+            # an event bigger than the whole buffer is sent on its own
+            self._send(data)
+            return
+
+        if not self.currentByteLength:
+            self._batchStarted = ticks_ms()
+        self._view[self.currentByteLength:self.currentByteLength+length] = data
+        self.currentByteLength += length
+        self.poll()
+
+    def poll(self):
+        # Method to call from your main loop, sends the partial batch once it is flushInterval seconds old
+
+        if self.currentByteLength and ticks_diff(ticks_ms(), self._batchStarted) >= self.flushInterval * 1000:
+            self.flush()
+
+    def flush(self):
+        # Method to send the partial batch now. Call it before sleeping or powering down.
+
+        if not self.currentByteLength:
+            return None
+        if http_event_collector_debug:
+            print("Batch Submit: %d bytes" % self.currentByteLength)
+        status = self._send(self._view[:self.currentByteLength])
+        self.currentByteLength = 0
+        return status
+
+    def close(self):
+        # Method to send the partial batch and close the HEC connection
+
+        self.flush()
+        self._disconnect()
+
+    def _send(self, body):
+        # Post a body, spooling it when HEC cannot be reached. Replays the spool after a successful post.
+
+        status = self._post(body)
+        if status == 200:
+            if self.spoolFile:
+                self._replaySpool()
+        elif status is None or status >= 500:
+            self._spool(body)
+        else:
+            # rejected by HEC, e.g. a bad token, resending would not help
+            self.dropped += 1
+        return status
+
+    def _connect(self):
+        addr = socket.getaddrinfo(self.http_event_server, self.http_event_port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.connect(addr)
+            if self.http_event_server_ssl:
+                if hasattr(ssl, 'SSLContext'):
+                    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                    sock = context.wrap_socket(sock, server_hostname=self.http_event_server)
+                else:
+                    sock = ssl.wrap_socket(sock, server_hostname=self.http_event_server)
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+        # MicroPython sockets are already streams, CPython needs a file object to read lines from
+        self._stream = sock.makefile('rb') if hasattr(sock, 'makefile') else sock
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+        self._sock = None
+        self._stream = None
+
+    def _post(self, body):
+        # POST over a kept alive connection, opening a new one if HEC closed the old one
+        # The response is read completely so nothing is left holding memory. Returns the status code or None.
+
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._exchange(body)
+            except Exception as err_msg:
+                self._disconnect()
+                if attempt:
+                    print(err_msg)
+        return None
+
+    def _exchange(self, body):
+        head = 'POST %s HTTP/1.1\r\nHost: %s:%d\r\nAuthorization: Splunk %s\r\nContent-Length: %d\r\n\r\n' % (self.path, self.http_event_server, self.http_event_port, self.token, len(body))
+        write = getattr(self._sock, 'sendall', None) or self._sock.write
+        write(head.encode())
+        write(body)
+
+        statusLine = self._stream.readline()
+        if not statusLine:
+            raise OSError("HEC closed the connection")
+        status = int(statusLine.split()[1])
+        length = 0
+        keepAlive = True
+        while True:
+            line = self._stream.readline()
+            if not line or line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                keepAlive = False
+        while length > 0:
+            chunk = self._stream.read(min(length, 256))
+            if not chunk:
+                break
+            if http_event_collector_debug:
+                print(chunk)
+            length -= len(chunk)
+        if not keepAlive:
+            self._disconnect()
+        return status
+
+    def _spool(self, body):
+        # Append a length prefixed batch to the flash spool file
+
+        if not self.spoolFile:
+            self.dropped += 1
+            return
+        try:
+            size = os.stat(self.spoolFile)[6]
+        except OSError:
+            size = 0
+        if size + len(body) + 8 > self.spoolMaxBytes:
+            self.dropped += 1
+            return
+        with open(self.spoolFile, 'ab') as f:
+            f.write(('%d\n' % len(body)).encode())
+            f.write(body)
+
+    def _replaySpool(self):
+        # Resend spooled batches oldest first. Batches not sent stay in the spool for the next attempt.
+        # The unsent rest is copied to a new file in small chunks, so memory use does not grow with the spool size.
+
+        try:
+            f = open(self.spoolFile, 'rb')
+        except OSError:
+            return
+        temp = None
+        with f:
+            while True:
+                start = f.tell()
+                header = f.readline()
+                if not header:
+                    break
+                body = f.read(int(header.decode()))
+                if self._post(body) != 200:
+                    f.seek(start)
+                    temp = self.spoolFile + '.tmp'
+                    self._copyRest(f, temp)
+                    break
+        os.remove(self.spoolFile)
+        if temp is not None:
+            os.rename(temp, self.spoolFile)
+
+    def _copyRest(self, source, path):
+        # Copy source from its current position to path through one small buffer
+
+        chunk = bytearray(256)
+        view = memoryview(chunk)
+        with open(path, 'wb') as f:
+            while True:
+                count = source.readinto(chunk)
+                if not count:
+                    break
+                f.write(view[:count])
 
     def set_ntp_time(self):
 
@@ -147,10 +375,11 @@ def main():
     # If you want to not include timestamp in json payloads force the HEC object to not include time
     # testeventJSON.includeTime = False
 
-    # Add 5 test events
+    # Batch 5 test events and send them in one post
     for i in range(5):
         payload.update({"event":{"action":"success","type":"json","message":"hello world","event_id":i}})
-        testeventJSON.sendEvent(payload)
+        testeventJSON.batchEvent(payload)
+    testeventJSON.close()
 
     sys.exit(0)
 